@@ -1,9 +1,23 @@
 import pytest
-from sqlalchemy import create_engine, text, MetaData
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text, MetaData
 from sqlalchemy.orm import sessionmaker, close_all_sessions, scoped_session
 
 from custom_stream_api.settings import DB_URI
-from custom_stream_api.shared import create_app, run_migrations, db as _db
+from custom_stream_api.alerts import cache as alerts_cache
+from custom_stream_api.alerts import media as alerts_media
+from custom_stream_api.alerts import search as alerts_search
+from custom_stream_api.alerts import usage as alerts_usage
+from custom_stream_api.chatbot import bans
+from custom_stream_api.counts import counts
+from custom_stream_api.counts import history as count_history
+from custom_stream_api.lists import lists
+from custom_stream_api.metrics import latency
+from custom_stream_api.shared import create_app, reset_versions, run_migrations, db as _db
+from custom_stream_api.tests.factories.alert_factories import AlertFactory, TagFactory, TagAssociationFactory
+from custom_stream_api.tests.factories.chatbot_factories import AliasFactory
+from custom_stream_api.tests.factories.counts_factories import CountFactory
+from custom_stream_api.tests.factories.lists_factories import ListFactory, ListItemFactory
 
 TEST_DB_NAME = f"test_{DB_URI.split('/')[-1]}"
 TEST_DB_URI = "/".join(DB_URI.split("/")[:-1]) + "/" + TEST_DB_NAME
@@ -61,6 +75,18 @@ def db(app, request):
 @pytest.fixture(scope="function")
 def session(db, request):
     """Creates a new database session for a test."""
+    # process-local caches would otherwise outlive the rolled back transaction
+    alerts_cache.clear()
+    alerts_media.clear()
+    alerts_search.invalidate()
+    alerts_usage.clear()
+    bans.invalidate()
+    counts.clear_pending()
+    counts.clear_updates()
+    count_history.clear()
+    lists.invalidate_names()
+    latency.reset()
+    reset_versions()
 
     with db.engine.connect() as connection:
         session = scoped_session(sessionmaker(bind=connection, binds={}))
@@ -84,3 +110,216 @@ def session(db, request):
 
     db.drop_all()
     close_all_sessions()
+
+
+@pytest.fixture(scope="function")
+def count_statements(session):
+    """Collects every statement sent to the database while in the returned context manager"""
+
+    @contextmanager
+    def count_statements():
+        statements = []
+
+        def count_statement(*args):
+            statements.append(args)
+
+        connection = _db.session.connection()
+        event.listen(connection, "before_cursor_execute", count_statement)
+        try:
+            yield statements
+        finally:
+            event.remove(connection, "before_cursor_execute", count_statement)
+
+    return count_statements
+
+
+# TEST DATA
+# Each fixture yields what it created
+
+
+@pytest.fixture(scope="function")
+def import_alerts(session):
+    session.query(AlertFactory._meta.model).delete()
+    session.commit()
+
+    TEST_ALERTS = [
+        AlertFactory(
+            name="test_text_1",
+            text="Test Text 1",
+            sound="http://www.test.com/test_sound_1.mp3",
+            image="",
+            thumbnail="",
+            effect="",
+        ),
+        AlertFactory(
+            name="test_text_2",
+            text="Test Text 2",
+            sound="http://www.test.com/test_sound_2.mp3",
+            image="",
+            thumbnail="",
+            effect="",
+        ),
+        AlertFactory(
+            name="test_text_3",
+            text="Test Text 3",
+            sound="http://www.test.com/test_sound_3.mp3",
+            image="",
+            thumbnail="",
+            effect="",
+        ),
+    ]
+
+    session.add_all(TEST_ALERTS)
+    session.commit()
+
+    yield TEST_ALERTS
+
+    session.query(AlertFactory._meta.model).delete()
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def import_tags(import_alerts, session):
+    session.query(TagAssociationFactory._meta.model).delete()
+    session.query(TagFactory._meta.model).delete()
+    session.commit()
+
+    TEST_TAGS = [
+        TagFactory(name="first_two", display_name="first two", thumbnail=None, chat_message=None, always_chat=False),
+        TagFactory(
+            name="last_two", display_name="last two", thumbnail=None, chat_message="last two!", always_chat=True
+        ),
+        TagFactory(name="random", display_name="random", thumbnail=None, chat_message=None, always_chat=False),
+    ]
+
+    TEST_TAG_ASSOCIATIONS = [
+        TagAssociationFactory(tag_name=TEST_TAGS[0].name, alert_name=import_alerts[0].name),
+        TagAssociationFactory(tag_name=TEST_TAGS[0].name, alert_name=import_alerts[1].name),
+        TagAssociationFactory(tag_name=TEST_TAGS[1].name, alert_name=import_alerts[1].name),
+        TagAssociationFactory(tag_name=TEST_TAGS[1].name, alert_name=import_alerts[2].name),
+    ]
+
+    session.add_all(TEST_TAG_ASSOCIATIONS)
+    session.add_all(TEST_TAGS)
+    session.commit()
+
+    yield TEST_TAGS
+
+    session.query(TagAssociationFactory._meta.model).delete()
+    session.query(TagFactory._meta.model).delete()
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def import_counts(session):
+    TEST_COUNTS = [
+        CountFactory(
+            name="count1",
+            count=-10,
+            tag_name=None,
+        ),
+        CountFactory(
+            name="count2",
+            count=20,
+            tag_name=None,
+        ),
+        CountFactory(
+            name="count3",
+            count=90,
+            tag_name=None,
+        ),
+    ]
+    TEST_COUNTS_DICTS = [test_count.as_dict() for test_count in TEST_COUNTS]
+    session.add_all(TEST_COUNTS)
+    session.commit()
+
+    yield TEST_COUNTS_DICTS
+
+    session.query(CountFactory._meta.model).delete()
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def import_tag_counts(import_tags, session):
+    session.query(CountFactory._meta.model).delete()
+    session.commit()
+
+    TEST_COUNTS = [
+        CountFactory(
+            name="count1",
+            count=37,
+            tag_name=import_tags[0].name,
+        ),
+        CountFactory(
+            name="count2",
+            count=2,
+            tag_name=import_tags[0].name,
+        ),
+    ]
+    session.add_all(TEST_COUNTS)
+    session.commit()
+
+    yield TEST_COUNTS
+
+    session.query(CountFactory._meta.model).delete()
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def import_lists(session):
+    session.query(ListItemFactory._meta.model).delete()
+    session.query(ListFactory._meta.model).delete()
+    session.commit()
+
+    TEST_LISTS = [
+        ListFactory(
+            name="list1",
+            size=3,
+        ),
+        ListFactory(
+            name="list2",
+            size=2,
+        ),
+    ]
+    start = ListItemFactory(list_name="list1", item="one", position=1)
+    TEST_LIST_ITEMS = [
+        start,
+        ListItemFactory(id=start.id + 1, list_name="list1", item="two", position=2),
+        ListItemFactory(id=start.id + 2, list_name="list1", item="three", position=3),
+        ListItemFactory(id=start.id + 3, list_name="list2", item="four", position=1),
+        ListItemFactory(id=start.id + 4, list_name="list2", item="five", position=2),
+    ]
+
+    session.add_all(TEST_LISTS)
+    session.add_all(TEST_LIST_ITEMS)
+    session.commit()
+
+    yield [test_list.as_dict() for test_list in TEST_LISTS]
+
+    session.query(ListItemFactory._meta.model).delete()
+    session.query(ListFactory._meta.model).delete()
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def import_aliases(session):
+    session.query(AliasFactory._meta.model).delete()
+    session.commit()
+
+    TEST_ALIASES = [
+        AliasFactory(alias="test_alert", badge="chat", command="!alert test_text_1"),
+        AliasFactory(alias="chat_test_alias", badge="chat", command="!get_count test_count"),
+        AliasFactory(alias="sub_test_alias", badge="subscriber", command="!get_count test_count"),
+        AliasFactory(alias="reset_session", badge="broadcaster", command="!reset_count test_count test_count_2"),
+        AliasFactory(alias="test_alias_args", badge="vip", command="!set_count test_count"),
+        AliasFactory(alias="mod_test_alias", badge="vip", command="!set_count test_count 10"),
+        AliasFactory(alias="broadcaster_test_alias", badge="broadcaster", command="!set_count test_count 10"),
+    ]
+
+    session.add_all(TEST_ALIASES)
+    session.commit()
+
+    yield [test_alias.as_dict() for test_alias in TEST_ALIASES]
+
+    session.query(AliasFactory._meta.model).delete()
+    session.commit()
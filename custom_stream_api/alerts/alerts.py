@@ -1,11 +1,34 @@
 import logging
 import re
 import random
-from sqlalchemy import func, null, sql
-
-from custom_stream_api.alerts.models import Alert, Tag, TagAssociation
+from datetime import datetime
+from sqlalchemy import (
+    ARRAY,
+    Text,
+    and_,
+    any_,
+    delete,
+    exists,
+    func,
+    literal,
+    or_,
+    select,
+    sql,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+
+from custom_stream_api.alerts import cache
+from custom_stream_api.alerts import dispatcher
+from custom_stream_api.alerts import media
+from custom_stream_api.alerts import search as search_index
+from custom_stream_api.alerts import usage
+from custom_stream_api.alerts.models import Alert, Tag, TagAssociation, Usage, serialize_alerts, serialize_tags
 from custom_stream_api.counts import counts
-from custom_stream_api.shared import db, get_app
+from custom_stream_api.metrics import latency
+from custom_stream_api.shared import bump_version, db, decode_cursor, encode_cursor, get_app
 
 logger = logging.getLogger(__name__)
 
@@ -87,6 +110,19 @@ def validate_tag_category(tag_category):
         raise ValueError(f"Invalid tag_category: {tag_category}")
 
 
+def _catalog_changed(alert_names=(), tag_names=(), refresh_media=False):
+    """Brings everything derived from the alert/tag catalog up to date after a write to these alerts and tags"""
+    for alert_name in alert_names:
+        cache.invalidate_alert(standardize_name(alert_name))
+    cache.invalidate_tags()
+    search_index.update(alert_names=alert_names, tag_names=tag_names)
+    bump_version("alerts")
+    if refresh_media:
+        media.refresh()
+    else:
+        media.update(alert_names)
+
+
 # ALERTS
 def save_alert(name, text="", sound="", effect="", image="", thumbnail="", tags=None, save=True):
     validate_sound(sound)
@@ -118,87 +154,100 @@ def save_alert(name, text="", sound="", effect="", image="", thumbnail="", tags=
 
     if save:
         db.session.commit()
+    # saving can rename the alert it found
+    _catalog_changed(alert_names=[standardize_name(name), found_alert.name])
+    cache.add_alert_name(found_alert.name)
     return found_alert
 
 
+def _set_associations(key_column, key, other_model, other_column, other_names):
+    """
+    Makes other_names the full set of associations for key in two statements: one DELETE for the ones that aren't
+    wanted anymore and one INSERT ... SELECT for the ones that are missing, *ignoring any names that don't exist*.
+    Returns the names that were added and removed.
+    """
+    other_names = sorted(set(other_names))
+    removed = db.session.scalars(
+        delete(TagAssociation)
+        .where(key_column == key, other_column.not_in(other_names))
+        .returning(other_column)
+        .execution_options(synchronize_session=False)
+    ).all()
+    added = []
+    if other_names:
+        associations_select = select(literal(key), other_model.name).where(
+            other_model.name == any_(literal(other_names, ARRAY(Text)))
+        )
+        added = db.session.scalars(
+            insert(TagAssociation)
+            .from_select([key_column.key, other_column.key], associations_select)
+            .on_conflict_do_nothing(constraint="_tag_uc")
+            .returning(other_column)
+        ).all()
+    return sorted(added), sorted(removed)
+
+
 def set_tags(alert_name, tags, save=True):
-    alert = db.session.query(Alert).filter_by(name=standardize_name(alert_name)).one_or_none()
-    if not alert:
+    found_alert_name = db.session.scalar(select(Alert.name).where(Alert.name == standardize_name(alert_name)))
+    if not found_alert_name:
         raise Exception(f"Alert not found: {alert_name}")
     if tags is None:
         raise Exception(f"Tags must be a list: {tags}")
 
-    # Ignore any tags that are already associated with this alert
-    existing_tags = (
-        db.session.query(Tag.name)
-        .join(TagAssociation, TagAssociation.tag_name == Tag.name)
-        .filter(TagAssociation.alert_name == alert.name)
-        .all()
-    )
-    existing_tag_names = set([tag[0] for tag in existing_tags])
-
-    # Delete current tags not in the new set
-    delete_tags = list(existing_tag_names - set(tags))
-    if delete_tags:
-        delete_associations = (
-            db.session.query(TagAssociation.id)
-            .join(Alert, TagAssociation.alert_name == Alert.name)
-            .join(Tag, TagAssociation.tag_name == Tag.name)
-            .filter(Alert.id == alert.id, Tag.name.in_(delete_tags))
-        )
-        delete_tags_ids = [result[0] for result in delete_associations]
-        logger.info(f"Deleting old tags from {alert.name}: {delete_tags}")
-        db.session.query(TagAssociation).filter(TagAssociation.id.in_(delete_tags_ids)).delete()
-
-        # Delete any lingering empty tags
-        empty_tags = (
-            db.session.query(Tag.id, Tag.name)
-            .outerjoin(TagAssociation, TagAssociation.tag_name == Tag.name)
-            .filter(TagAssociation.id == null())
-            .all()
-        )
-        empty_tag_names = [result[1] for result in empty_tags]
-        logger.info(f"Deleting empty tags: {empty_tag_names}")
-        db.session.query(Tag).filter(Tag.name.in_(empty_tag_names)).delete()
-
-    # Set any new tags, *ignoring any tags that don't exist*
-    new_tags = set(tags) - existing_tag_names
-    if new_tags:
-        logger.info(f"Setting new tags to {alert.name}: {new_tags}")
-        for tag_name in new_tags:
-            tag = db.session.query(Tag).filter_by(name=tag_name).one_or_none()
-            if not tag:
-                continue
-            db.session.add(TagAssociation(alert=alert, tag=tag))
+    added, removed = _set_associations(TagAssociation.alert_name, found_alert_name, Tag, TagAssociation.tag_name, tags)
+    if removed:
+        logger.info(f"Deleted old tags from {found_alert_name}: {removed}")
+
+        # Delete any of those tags left empty
+        empty_tags = db.session.scalars(
+            delete(Tag)
+            .where(Tag.name.in_(removed), ~exists().where(TagAssociation.tag_name == Tag.name))
+            .returning(Tag.name)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if empty_tags:
+            logger.info(f"Deleted empty tags: {empty_tags}")
+    if added:
+        logger.info(f"Set new tags to {found_alert_name}: {added}")
 
     if save:
         db.session.commit()
-
-
-def alert(name=None, text="", sound="", effect="", image="", hit_socket=True, chat=None, live=True):
+    # reloading the tags reloads which alerts they have
+    _catalog_changed(tag_names=added + removed)
+    return {"added": added, "removed": removed}
+
+
+def alert(
+    name=None,
+    text="",
+    sound="",
+    effect="",
+    image="",
+    hit_socket=True,
+    chat=None,
+    live=True,
+    priority=dispatcher.PRIORITY_DASHBOARD,
+    tag=None,
+):
     if name:
-        alert_obj = db.session.query(Alert).filter_by(name=standardize_name(name)).one_or_none()
-        if not alert_obj:
+        alert_name = standardize_name(name)
+        socket_data = cache.get_alert(alert_name)
+        if not socket_data:
             raise Exception(f"Alert not found: {name}")
-        alert_data = alert_obj.as_dict()
-        socket_data = {
-            "text": alert_data["text"],
-            "sound": alert_data["sound"],
-            "effect": alert_data["effect"],
-            "image": alert_data["image"],
-        }
+        usage.record("Alert", alert_name)
     else:
         validate_sound(sound)
         effect = validate_effect(effect)
         validate_image(image)
         socket_data = {"text": text, "sound": sound, "effect": effect, "image": image}
     logger.info(socket_data)
+    latency.mark("lookup")
 
     app = get_app()
     if hit_socket:
         namespace = "live" if live else "preview"
-        # add to queue, background async process will take it
-        app.socketio_queue.sync_q.put({"namespace": namespace, "data": socket_data})
+        # add to the overlay queue, background async process will take it
+        app.overlay_dispatcher.put(namespace, socket_data, priority=priority, tag=tag, trace=latency.hand_off())
 
     if (chat is not None or socket_data["text"]) and getattr(app, "twitch_chatbot", None):
         # default is the alert text, but can be overridden (previously for reminders)
@@ -210,10 +259,10 @@ def alert(name=None, text="", sound="", effect="", image="", hit_socket=True, ch
 
 
 def alert_details(name):
-    found_alert = db.session.query(Alert).filter_by(name=standardize_name(name)).one_or_none()
-    if not found_alert:
+    found_alerts = serialize_alerts([standardize_name(name)])
+    if not found_alerts:
         raise Exception(f"Alert not found: {name}")
-    return found_alert.as_dict()
+    return found_alerts[0]
 
 
 def remove_alert(name):
@@ -222,8 +271,11 @@ def remove_alert(name):
         alert_name = alert.one_or_none().name
 
         alert.delete()
+        usage.remove("Alert", alert_name)
 
         db.session.commit()
+        _catalog_changed(alert_names=[alert_name])
+        cache.remove_alert_name(alert_name)
         return alert_name
     else:
         raise Exception(f"Alert not found: {name}")
@@ -261,13 +313,14 @@ def save_tag(
 
     if save:
         db.session.commit()
+    _catalog_changed(tag_names=[found_tag.name])
 
     return found_tag
 
 
 def set_alerts(tag_name, alerts, save=True):
-    tag = db.session.query(Tag).filter_by(name=standardize_name(tag_name)).one_or_none()
-    if not tag:
+    found_tag_name = db.session.scalar(select(Tag.name).where(Tag.name == standardize_name(tag_name)))
+    if not found_tag_name:
         raise Exception(f"Tag not found: {tag_name}")
     if alerts is None:
         raise Exception(f"Alerts must be a list: {alerts}")
@@ -275,59 +328,54 @@ def set_alerts(tag_name, alerts, save=True):
     # standardize incoming alerts
     alerts = [standardize_name(alert) for alert in alerts]
 
-    # Ignore any tags that are already associated with this alert
-    existing_alerts = (
-        db.session.query(Alert.name)
-        .join(TagAssociation, TagAssociation.alert_name == Alert.name)
-        .filter(TagAssociation.tag_name == tag.name)
-        .all()
+    # Unlike set_tags, we're *not* deleting any alerts that dont have tags
+    added, removed = _set_associations(
+        TagAssociation.tag_name, found_tag_name, Alert, TagAssociation.alert_name, alerts
     )
-    existing_alert_names = set([tag[0] for tag in existing_alerts])
-
-    # Delete current tags not in the new set
-    delete_alerts = list(existing_alert_names - set(alerts))
-    if delete_alerts:
-        delete_associations = (
-            db.session.query(TagAssociation.id)
-            .join(Alert, TagAssociation.alert_name == Alert.name)
-            .join(Tag, TagAssociation.tag_name == Tag.name)
-            .filter(Tag.id == tag.id, Alert.name.in_(delete_alerts))
-        )
-        delete_alerts_ids = [result[0] for result in delete_associations]
-        logger.info(f"Deleting old tags from {tag.name}: {delete_alerts}")
-        db.session.query(TagAssociation).filter(TagAssociation.id.in_(delete_alerts_ids)).delete()
-
-        # Unlike set_tags, we're *not* deleting any alerts that dont have tags
-
-    # Set any new tags, *ignoring any alerts that don't exist*
-    new_alerts = set(alerts) - existing_alert_names
-    if new_alerts:
-        logger.info(f"Setting new tags to {tag.name}: {new_alerts}")
-        for alert_name in new_alerts:
-            alert = db.session.query(Alert).filter_by(name=alert_name).one_or_none()
-            if not alert:
-                continue
-            db.session.add(TagAssociation(alert=alert, tag=tag))
+    if removed:
+        logger.info(f"Deleted old alerts from {found_tag_name}: {removed}")
+    if added:
+        logger.info(f"Set new alerts to {found_tag_name}: {added}")
 
     if save:
         db.session.commit()
-
-
-def tag_alert(name, random_choice=True, hit_socket=True, chat=None, live=True):
-    tag = db.session.query(Tag).filter_by(name=standardize_name(name)).one_or_none()
+    _catalog_changed(tag_names=[found_tag_name])
+    return {"added": added, "removed": removed}
+
+
+def next_index(tag_name, size):
+    """
+    Advances the tag's round-robin cursor in a single UPDATE ... RETURNING and returns the index to play. The row lock
+    makes concurrent triggers (chatbot, scheduler, HTTP) each get their own index.
+    """
+    new_index = db.session.execute(
+        update(Tag)
+        .where(Tag.name == tag_name)
+        .values(current_index=(func.coalesce(Tag.current_index, 0) % size + 1) % size)
+        .returning(Tag.current_index)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    db.session.commit()
+    bump_version("alerts")
+    return (new_index - 1) % size
+
+
+def tag_alert(name, random_choice=True, hit_socket=True, chat=None, live=True, priority=dispatcher.PRIORITY_DASHBOARD):
+    tag = cache.get_tag(standardize_name(name))
     if not tag:
         raise Exception(f"Tag not found: {name}")
     if tag.name != "random":
-        alert_names = tag.as_dict()["alerts"]
+        alert_names = tag.alerts
+        if not alert_names:
+            raise Exception(f"Tag has no alerts: {name}")
         if random_choice:
             chosen_alert = random.choice(alert_names)
         else:
-            chosen_alert = alert_names[tag.current_index]
-            tag.current_index = (tag.current_index + 1) % len(alert_names)
-            db.session.commit()
+            chosen_alert = alert_names[next_index(tag.name, len(alert_names))]
     else:
-        all_alerts = db.session.query(Alert.name).all()
-        chosen_alert = random.choice([alert[0] for alert in all_alerts])
+        chosen_alert = cache.random_alert_name()
+        if not chosen_alert:
+            raise Exception("No alerts to choose from")
 
     app = get_app()
     twitch_chatbot = getattr(app, "twitch_chatbot", None)
@@ -337,22 +385,25 @@ def tag_alert(name, random_choice=True, hit_socket=True, chat=None, live=True):
         if isinstance(chat, str) and len(chat.strip()) > 0:
             override_chat_message = chat
 
-    alert_data = alert(chosen_alert, hit_socket=hit_socket, chat=override_chat_message, live=live)
+    alert_data = alert(
+        chosen_alert, hit_socket=hit_socket, chat=override_chat_message, live=live, priority=priority, tag=tag.name
+    )
+    usage.record("Tag", tag.name)
 
     # add to counts
-    for count in tag.counts:
-        amount = counts.add_to_count(count.name)
+    for count_name in tag.counts:
+        amount = counts.add_to_count(count_name)
         if twitch_chatbot and (chat or tag.always_chat):
-            twitch_chatbot.chat_count_output(count.name, amount)
+            twitch_chatbot.chat_count_output(count_name, amount)
 
     return alert_data
 
 
 def tag_details(name):
-    found_tag = db.session.query(Tag).filter_by(name=standardize_name(name)).one_or_none()
-    if not found_tag:
+    found_tags = serialize_tags([standardize_name(name)])
+    if not found_tags:
         raise Exception(f"Tag not found: {name}")
-    return found_tag.as_dict()
+    return found_tags[0]
 
 
 def remove_tag(name):
@@ -364,121 +415,381 @@ def remove_tag(name):
         tag_name = tag.one_or_none().name
 
         tag.delete()
+        usage.remove("Tag", tag_name)
 
         db.session.commit()
+        _catalog_changed(tag_names=[tag_name])
         return tag_name
     else:
         raise Exception(f"Tag not found: {name}")
 
 
-# BROWSE
-def apply_filters(list_query, sort_options, search_attr, sort="name", page=1, limit=None, search=None):
-    if sort:
-        sort_options.update({f"-{sort_option}": sort_value for sort_option, sort_value in sort_options.items()})
-        if sort not in sort_options:
-            raise ValueError(f"Invalid sort option: {sort}")
-        order_by = sort_options[sort].desc() if sort[0] == "-" else sort_options[sort].asc()
-
-    if search and isinstance(search, str):
-        list_query = list_query.filter(func.lower(search_attr).contains(standardize_name(search)))
-    if sort:
-        list_query = list_query.order_by(order_by)
-    if page and limit:
-        page = int(page)
-        index_0_page = page - 1
-        limit = int(limit)
-        start = index_0_page * limit
-        end = start + limit
-        results = list_query.slice(start, end)
-    elif limit:
-        limit = int(limit)
-        results = list_query.limit(limit)
-    else:
-        results = list_query.all()
-
-    total = list_query.count()
-    page_metadata = {"total": total, "page": page or 1, "limit": limit}
-
-    return results, page_metadata
-
+# IMPORT
+def _import_alert_row(alert_row):
+    if not alert_row.get("name"):
+        raise ValueError("Missing name")
+    validate_sound(alert_row.get("sound") or "")
+    validate_image(alert_row.get("image") or "")
+    return {
+        "name": standardize_name(alert_row["name"]),
+        "text": alert_row.get("text") or "",
+        "sound": alert_row.get("sound") or "",
+        "effect": validate_effect(alert_row.get("effect")),
+        "image": alert_row.get("image") or "",
+        "thumbnail": validate_thumbnail(alert_row.get("thumbnail") or ""),
+    }
+
+
+def _import_tag_row(tag_row):
+    if not tag_row.get("name"):
+        raise ValueError("Missing name")
+    if not tag_row.get("display_name"):
+        raise ValueError("Missing display_name")
+    return {
+        "name": standardize_name(tag_row["name"]),
+        "display_name": tag_row["display_name"],
+        "thumbnail": validate_thumbnail(tag_row.get("thumbnail") or ""),
+        "category": validate_tag_category(tag_row.get("category") or "content"),
+        "always_chat": bool(tag_row.get("always_chat", False)),
+        "chat_message": tag_row.get("chat_message"),
+    }
+
+
+def _upsert(model, rows):
+    if not rows:
+        return
+    upsert = insert(model)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[model.name],
+        set_={column: upsert.excluded[column] for column in rows[0] if column != "name"},
+    )
+    db.session.execute(upsert, rows)
+
+
+def import_alerts(alerts=None, tags=None):
+    """
+    Saves many alerts and tags at once, like save_alert/save_tag would one by one.
+
+    Every row is validated up front, rows that fail are skipped and reported in "errors". The rest is written in a
+    single transaction: one upsert for the alerts, one for the tags and one insert for the associations listed in
+    either the alerts' "tags" or the tags' "alerts". Associations are only ever added, and like set_tags/set_alerts,
+    ones pointing at alerts or tags that don't exist are ignored.
+    """
+    alerts = alerts or []
+    tags = tags or []
+    errors = []
+    alert_rows = {}
+    tag_rows = {}
+    associations = set()
+
+    for index, alert_row in enumerate(alerts):
+        try:
+            validated_row = _import_alert_row(alert_row)
+        except Exception as e:
+            errors.append({"type": "alert", "index": index, "name": alert_row.get("name"), "message": str(e)})
+            continue
+        # the last row for a name wins, an upsert can't touch the same row twice
+        alert_rows[validated_row["name"]] = validated_row
+        for tag_name in alert_row.get("tags") or []:
+            associations.add((standardize_name(tag_name), validated_row["name"]))
+
+    for index, tag_row in enumerate(tags):
+        try:
+            validated_row = _import_tag_row(tag_row)
+        except Exception as e:
+            errors.append({"type": "tag", "index": index, "name": tag_row.get("name"), "message": str(e)})
+            continue
+        tag_rows[validated_row["name"]] = validated_row
+        for alert_name in tag_row.get("alerts") or []:
+            associations.add((validated_row["name"], standardize_name(alert_name)))
+
+    try:
+        _upsert(Alert, list(alert_rows.values()))
+        _upsert(Tag, list(tag_rows.values()))
+
+        added_associations = 0
+        if associations:
+            tag_names = {tag_name for tag_name, _ in associations}
+            alert_names = {alert_name for _, alert_name in associations}
+            found_tags = set(db.session.scalars(select(Tag.name).where(Tag.name.in_(tag_names))))
+            found_alerts = set(db.session.scalars(select(Alert.name).where(Alert.name.in_(alert_names))))
+            association_rows = [
+                {"tag_name": tag_name, "alert_name": alert_name}
+                for tag_name, alert_name in sorted(associations)
+                if tag_name in found_tags and alert_name in found_alerts
+            ]
+            if association_rows:
+                association_insert = (
+                    insert(TagAssociation).on_conflict_do_nothing(constraint="_tag_uc").returning(TagAssociation.id)
+                )
+                added_associations = len(db.session.execute(association_insert, association_rows).all())
 
-def get_exploded_alerts(search, sort):
-    tag_query = (
-        db.session.query(
-            Alert.name, Alert.thumbnail, sql.expression.literal_column("'Alert'").label("result_type"), Alert.text
-        )
-        .join(TagAssociation, TagAssociation.alert_name == Alert.name)
-        .join(Tag, TagAssociation.tag_name == Tag.name)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # the index is updated in place, the associations touch alerts and tags that weren't imported themselves
+    _catalog_changed(
+        alert_names=set(alert_rows) | {alert_name for _, alert_name in associations},
+        tag_names=set(tag_rows) | {tag_name for tag_name, _ in associations},
+        refresh_media=True,
     )
-    sort_options = {"name": Tag.name, "created_at": Tag.created_at}
-    exploded_alerts, _ = apply_filters(tag_query, sort_options, TagAssociation.tag_name, sort=sort, search=search)
-    return exploded_alerts
+    for alert_name in alert_rows:
+        cache.add_alert_name(alert_name)
+
+    logger.info(f"Imported {len(alert_rows)} alerts, {len(tag_rows)} tags, {added_associations} associations")
+    return {
+        "alerts": len(alert_rows),
+        "tags": len(tag_rows),
+        "associations": added_associations,
+        "errors": errors,
+    }
 
 
-def paginate(data, page_number, items_per_page):
-    start_index = (page_number - 1) * items_per_page
-    end_index = start_index + items_per_page
-    return data[start_index:end_index]
+# BROWSE
+# popular: most triggered lately first
+SORT_OPTIONS = ["name", "created_at", "popular"]
 
 
 def browse(
-    sort="name", page=1, limit=MAX_LIMIT, search=None, include_alerts=True, include_tags=True, tag_category=None
+    sort="name",
+    page=1,
+    limit=MAX_LIMIT,
+    search=None,
+    include_alerts=True,
+    include_tags=True,
+    tag_category=None,
+    cursor=None,
+    include_total=True,
 ):
-    # TODO: sort by popularity
+    """
+    Tags > matched alerts > alerts from matched tags, sorted and paginated. Searches are answered from the in-memory
+    search index, ranked by relevance within each tier. The total is the number of results across all pages.
+
+    Pages can be walked by page number or by passing back the next_cursor from the previous page, which picks up right
+    after its last result instead of skipping over every result before it. Leaving out the total skips counting them.
+    """
+    sort = sort or "name"
+    if sort.lstrip("-") not in SORT_OPTIONS:
+        raise ValueError(f"Invalid sort option: {sort}")
+    if tag_category:
+        tag_category = validate_tag_category(tag_category)
+    page = int(page or 1) if not cursor else None
+    limit = int(limit) if limit else None
+    offset = (page - 1) * limit if limit and page else 0
 
-    results = []
-    if include_alerts:
-        tag_results = []
-        if include_tags:
-            tag_query = db.session.query(
-                Tag.name, Tag.thumbnail, sql.expression.literal_column("'Tag'").label("result_type"), Tag.display_name
-            )
-            if tag_category:
-                tag_category = validate_tag_category(tag_category)
-                tag_query = tag_query.filter_by(category=tag_category)
-            sort_options = {"name": Tag.name, "created_at": Tag.created_at}
-            tag_results, _ = apply_filters(tag_query, sort_options, Tag.name, sort=sort, search=search)
-
-        # same thing minus page + limit
-        alert_query = db.session.query(
-            Alert.name,
-            Alert.thumbnail,
-            sql.expression.literal_column("'Alert'").label("result_type"),
-            Alert.text.label("display_name"),
+    if search and isinstance(search, str):
+        if cursor:
+            offset = decode_cursor(cursor, "offset", sort=sort, search=search)
+        ranked = search_index.search(
+            search, sort=sort, include_alerts=include_alerts, include_tags=include_tags, tag_category=tag_category
         )
-        sort_options = {"name": Alert.name, "created_at": Alert.created_at}
-        alert_results, _ = apply_filters(alert_query, sort_options, Alert.name, sort=sort, search=search)
-        alert_names = [alert.name for alert in list(alert_results)]
-
-        exploded_alerts = []
-        if search:
-            exploded_alerts = get_exploded_alerts(search, sort)
-            # dedupe, prioritize on matched alerts
-            exploded_alerts = [
-                exploded_alert for exploded_alert in list(exploded_alerts) if exploded_alert.name not in alert_names
-            ]
-
-        # tags > matched alerts > exploded alerts from tags
-        results = list(tag_results) + list(alert_results) + exploded_alerts
-        results = list(dict.fromkeys(results))
-        results = paginate(results, int(page), int(limit))
-        page_metadata = {"total": len(results), "limit": limit, "page": page}
+        total = len(ranked) if include_total else None
+        end = offset + limit if limit else len(ranked)
+        page_results = [
+            (entry.name, entry.thumbnail, entry.result_type, entry.display_name) for _, _, entry in ranked[offset:end]
+        ]
+        next_cursor = encode_cursor({"sort": sort, "search": search, "offset": end}) if end < len(ranked) else None
     else:
-        tag_query = db.session.query(
-            Tag.name, Tag.thumbnail, sql.expression.literal_column("'Tag'").label("result_type"), Tag.display_name
+        after = decode_cursor(cursor, "after", sort=sort, search=None) if cursor else None
+        page_results, total, next_position = browse_query(
+            sort, offset, limit, include_alerts, include_tags, tag_category, after=after, include_total=include_total
+        )
+        next_cursor = encode_cursor({"sort": sort, "after": next_position}) if next_position else None
+    page_metadata = {"total": total, "page": page, "limit": limit, "next_cursor": next_cursor}
+
+    search_results = [
+        {"name": result[0], "thumbnail": result[1], "type": result[2], "display_name": result[3]}
+        for result in page_results
+    ]
+    return search_results, page_metadata
+
+
+def browse_query(sort, offset, limit, include_alerts, include_tags, tag_category, after=None, include_total=True):
+    """
+    One query for the whole page, returning the page's rows, the total (None if not included) and the position to
+    continue from if there are more.
+
+    Results are ordered by (priority, sort key, name), with the name following the sort's direction, so after a
+    position is a row comparison the (created_at, name) indexes can seek to.
+    """
+    descending = sort[0] == "-"
+    sort_column = sort.lstrip("-")
+    if sort_column == "popular":
+        return browse_popular(
+            descending, offset, limit, include_alerts, include_tags, tag_category, after, include_total
         )
+
+    def result_select(model, result_type, display_name, priority):
+        return select(
+            model.name.label("name"),
+            model.thumbnail.label("thumbnail"),
+            sql.expression.literal_column(f"'{result_type}'").label("result_type"),
+            display_name.label("display_name"),
+            sql.expression.literal_column(str(priority)).label("priority"),
+            getattr(model, sort_column).label("sort_key"),
+        )
+
+    selects = []
+    if include_tags or not include_alerts:
+        tag_select = result_select(Tag, "Tag", Tag.display_name, 0)
         if tag_category:
-            tag_category = validate_tag_category(tag_category)
-            tag_query = tag_query.filter_by(category=tag_category)
-        sort_options = {"name": Tag.name, "created_at": Tag.created_at}
-        results, page_metadata = apply_filters(
-            tag_query, sort_options, Tag.name, sort=sort, search=search, page=page, limit=limit
+            tag_select = tag_select.where(Tag.category == tag_category)
+        selects.append(tag_select)
+    if include_alerts:
+        selects.append(result_select(Alert, "Alert", Alert.text, 1))
+    results = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+
+    columns = [
+        results.c.name,
+        results.c.thumbnail,
+        results.c.result_type,
+        results.c.display_name,
+        results.c.priority,
+        results.c.sort_key,
+    ]
+    # the window count only counts everything when there's no cursor narrowing the rows down
+    window_total = include_total and after is None
+    if window_total:
+        columns.append(func.count().over().label("total"))
+
+    if descending:
+        order_by = [results.c.priority, results.c.sort_key.desc(), results.c.name.desc()]
+    else:
+        order_by = [results.c.priority, results.c.sort_key.asc(), results.c.name.asc()]
+    page_query = select(*columns).order_by(*order_by)
+
+    if after is not None:
+        after_priority, after_sort_key, after_name = after
+        if sort_column == "created_at":
+            after_sort_key = datetime.fromisoformat(after_sort_key)
+        sort_position = tuple_(results.c.sort_key, results.c.name)
+        after_sort_position = tuple_(after_sort_key, after_name)
+        page_query = page_query.where(
+            or_(
+                results.c.priority > after_priority,
+                and_(
+                    results.c.priority == after_priority,
+                    sort_position < after_sort_position if descending else sort_position > after_sort_position,
+                ),
+            )
         )
+    else:
+        page_query = page_query.offset(offset)
+    # one extra row to know if there's another page
+    page_results = db.session.execute(page_query.limit(limit + 1 if limit else None)).all()
+    next_position = None
+    if limit and len(page_results) > limit:
+        page_results = page_results[:limit]
+        last = page_results[-1]
+        last_sort_key = last.sort_key.isoformat() if isinstance(last.sort_key, datetime) else last.sort_key
+        next_position = [int(last.priority), last_sort_key, last.name]
+
+    if not include_total:
+        total = None
+    elif window_total and page_results:
+        total = page_results[0].total
+    elif window_total and not offset:
+        total = 0
+    else:
+        # past the last page the window count has no rows to ride on, and after a cursor it only counts what's left
+        total = db.session.execute(select(func.count()).select_from(results)).scalar()
+    return page_results, total, next_position
 
-    def dict_results(results):
-        return [
-            {"name": result[0], "thumbnail": result[1], "type": result[2], "display_name": result[3]}
-            for result in list(results)
-        ]
 
-    return dict_results(results), page_metadata
+def browse_popular(
+    descending, offset, limit, include_alerts, include_tags, tag_category, after=None, include_total=True
+):
+    """
+    browse_query for sort="popular". Within each tier, what was triggered comes first, read off the usage table's
+    (result_type, score) index most popular first, then what never was by name. "-popular" is the reverse within each
+    tier. Pages are filled from one segment after the other, so no page sorts the whole catalog.
+
+    Positions are (priority, score, name), the score being None for never triggered.
+    """
+    segments = []
+    totals = []
+    for include, priority, model, result_type, display_name in [
+        (include_tags or not include_alerts, 0, Tag, "Tag", Tag.display_name),
+        (include_alerts, 1, Alert, "Alert", Alert.text),
+    ]:
+        if not include:
+            continue
+        columns = [
+            model.name.label("name"),
+            model.thumbnail.label("thumbnail"),
+            sql.expression.literal_column(f"'{result_type}'").label("result_type"),
+            display_name.label("display_name"),
+            sql.expression.literal_column(str(priority)).label("priority"),
+        ]
+        triggered = (
+            select(*columns, Usage.score.label("score"))
+            .select_from(Usage)
+            .join(model, model.name == Usage.name)
+            .where(Usage.result_type == result_type)
+        )
+        used = exists().where(Usage.result_type == result_type, Usage.name == model.name)
+        never_triggered = select(*columns, sql.expression.null().label("score")).where(~used)
+        count = select(func.count()).select_from(model)
+        if model is Tag and tag_category:
+            triggered = triggered.where(Tag.category == tag_category)
+            never_triggered = never_triggered.where(Tag.category == tag_category)
+            count = count.where(Tag.category == tag_category)
+        totals.append(count)
+
+        if descending:
+            segments.append((priority, False, model, never_triggered.order_by(model.name.desc())))
+            segments.append((priority, True, model, triggered.order_by(Usage.score.asc(), model.name.desc())))
+        else:
+            segments.append((priority, True, model, triggered.order_by(Usage.score.desc(), model.name.asc())))
+            segments.append((priority, False, model, never_triggered.order_by(model.name.asc())))
+
+    if after is not None:
+        after_priority, after_score, after_name = after
+        after_segment = (after_priority, after_score is not None)
+        # everything before the segment the position is in was on earlier pages
+        while segments and segments[0][:2] != after_segment:
+            segments.pop(0)
+        if segments:
+            priority, is_triggered, model, segment = segments[0]
+            name_column = model.name
+            if not is_triggered:
+                segment = segment.where(name_column < after_name if descending else name_column > after_name)
+            elif descending:
+                # the redundant bound lets the index seek straight to the position
+                segment = segment.where(
+                    Usage.score >= after_score,
+                    or_(Usage.score > after_score, and_(Usage.score == after_score, name_column < after_name)),
+                )
+            else:
+                segment = segment.where(
+                    Usage.score <= after_score,
+                    or_(Usage.score < after_score, and_(Usage.score == after_score, name_column > after_name)),
+                )
+            segments[0] = (priority, is_triggered, model, segment)
+
+    page_results = []
+    for _, _, _, segment in segments:
+        if offset:
+            # skip whole segments until the one the offset lands in
+            segment_size = db.session.execute(select(func.count()).select_from(segment.subquery())).scalar()
+            if segment_size <= offset:
+                offset -= segment_size
+                continue
+            segment = segment.offset(offset)
+            offset = 0
+        # one extra row to know if there's another page
+        if limit:
+            segment = segment.limit(limit + 1 - len(page_results))
+        page_results.extend(db.session.execute(segment).all())
+        if limit and len(page_results) > limit:
+            break
+
+    next_position = None
+    if limit and len(page_results) > limit:
+        page_results = page_results[:limit]
+        last = page_results[-1]
+        next_position = [int(last.priority), last.score, last.name]
+
+    total = sum(db.session.execute(count).scalar() for count in totals) if include_total else None
+    return page_results, total, next_position
@@ -0,0 +1,138 @@
+"""
+Process-local catalog of alerts and tags so triggering them doesn't need the database
+"""
+
+import random
+import threading
+from collections import namedtuple
+
+from custom_stream_api.alerts.models import Alert, serialize_tags
+from custom_stream_api.counts.models import Count
+from custom_stream_api.shared import db
+
+# alerts: standardized alert name -> socket payload
+# tags: standardized tag name -> CachedTag
+CachedTag = namedtuple("CachedTag", ["name", "alerts", "counts", "always_chat", "chat_message"])
+
+_alerts = {}
+_tags = {}
+
+# every alert name in a flat list for the "random" tag, with each name's position so removing one is a swap and pop
+_alert_names = None
+_alert_positions = {}
+
+# Bumped on every invalidation so a lookup that raced with a write doesn't store what it read
+_generation = 0
+_lock = threading.Lock()
+
+
+def _store(cache, key, value, generation):
+    with _lock:
+        if generation == _generation:
+            cache[key] = value
+
+
+def get_alert(name):
+    """Returns a copy of the socket payload for the alert, or None if it doesn't exist"""
+    socket_data = _alerts.get(name)
+    if socket_data is None:
+        generation = _generation
+        found_alert = (
+            db.session.query(Alert.text, Alert.sound, Alert.effect, Alert.image).filter_by(name=name).one_or_none()
+        )
+        if not found_alert:
+            return None
+        socket_data = {
+            "text": found_alert.text,
+            "sound": found_alert.sound,
+            "effect": found_alert.effect,
+            "image": found_alert.image,
+        }
+        _store(_alerts, name, socket_data, generation)
+    return dict(socket_data)
+
+
+def get_tag(name):
+    """Returns the CachedTag for the tag, or None if it doesn't exist"""
+    cached_tag = _tags.get(name)
+    if cached_tag is None:
+        generation = _generation
+        found_tags = serialize_tags([name])
+        if not found_tags:
+            return None
+        tag_dict = found_tags[0]
+        counts_query = db.session.query(Count.name).filter(Count.tag_name == tag_dict["name"]).order_by(Count.name)
+        cached_tag = CachedTag(
+            name=tag_dict["name"],
+            alerts=tuple(tag_dict["alerts"]),
+            counts=tuple(result[0] for result in counts_query),
+            always_chat=tag_dict["always_chat"],
+            chat_message=tag_dict["chat_message"],
+        )
+        _store(_tags, name, cached_tag, generation)
+    return cached_tag
+
+
+def random_alert_name():
+    """An alert name picked uniformly at random, or None if there are no alerts"""
+    global _alert_names, _alert_positions
+    # removing a name swaps and pops the list, so only pick from it under the lock
+    with _lock:
+        if _alert_names is not None:
+            return random.choice(_alert_names) if _alert_names else None
+        generation = _generation
+
+    alert_names = [result[0] for result in db.session.query(Alert.name)]
+    with _lock:
+        if generation == _generation:
+            _alert_names = alert_names
+            _alert_positions = {name: position for position, name in enumerate(alert_names)}
+        return random.choice(alert_names) if alert_names else None
+
+
+def add_alert_name(name):
+    global _generation
+    with _lock:
+        if _alert_names is None:
+            # make sure a load that started before this alert existed doesn't get stored
+            _generation += 1
+        elif name not in _alert_positions:
+            _alert_positions[name] = len(_alert_names)
+            _alert_names.append(name)
+
+
+def remove_alert_name(name):
+    global _generation
+    with _lock:
+        if _alert_names is None:
+            _generation += 1
+        elif name in _alert_positions:
+            position = _alert_positions.pop(name)
+            last_name = _alert_names.pop()
+            if last_name != name:
+                _alert_names[position] = last_name
+                _alert_positions[last_name] = position
+
+
+def invalidate_alert(name):
+    global _generation
+    with _lock:
+        _generation += 1
+        _alerts.pop(name, None)
+
+
+def invalidate_tags():
+    global _generation
+    with _lock:
+        _generation += 1
+        _tags.clear()
+
+
+def clear():
+    global _generation, _alert_names
+    with _lock:
+        _generation += 1
+        _alerts.clear()
+        _tags.clear()
+        _alert_names = None
+        _alert_positions.clear()
@@ -0,0 +1,156 @@
+"""
+Sits between alert() and the overlay so a raid spamming !tag can't flood it
+
+Alerts wait in a bounded queue and are sent at most max_per_second, most important first. On the way in:
+- an alert identical to one still waiting (within coalesce_seconds) is merged into it, the overlay gets one alert with
+  a multiplier instead of a pile of overlapping sounds
+- a tag triggered again within tag_cooldown seconds is dropped
+- when the queue is full, drop_policy decides: "newest" drops the incoming alert, "lowest_priority" makes room by
+  dropping the least important, newest waiting alert if the incoming one is more important
+The latency trace of an alert that won't be sent on its own is finished right away, marked "merged" or "dropped".
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# lower goes first
+PRIORITY_DASHBOARD = 0
+PRIORITY_CHAT = 1
+
+DROP_POLICIES = ["newest", "lowest_priority"]
+
+
+def _finish_trace(trace, stage):
+    """Finishes the trace of an alert the emitter won't send, it would never be recorded otherwise"""
+    if trace:
+        trace.mark(stage)
+        trace.finish()
+
+
+class _Entry:
+    __slots__ = ["priority", "seq", "namespace", "data", "key", "multiplier", "enqueued_at", "trace"]
+
+    def __init__(self, priority, seq, namespace, data, key, enqueued_at, trace):
+        self.priority = priority
+        self.seq = seq
+        self.namespace = namespace
+        self.data = data
+        self.key = key
+        self.multiplier = 1
+        self.enqueued_at = enqueued_at
+        self.trace = trace
+
+    def message(self):
+        data = dict(self.data)
+        if self.multiplier > 1:
+            data["multiplier"] = self.multiplier
+        return {"namespace": self.namespace, "data": data, "trace": self.trace}
+
+
+class OverlayDispatcher:
+    def __init__(
+        self, max_size=50, drop_policy="lowest_priority", coalesce_seconds=2, max_per_second=5, tag_cooldown=0
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Invalid drop_policy: {drop_policy}")
+        self.max_size = max_size
+        self.drop_policy = drop_policy
+        self.coalesce_seconds = coalesce_seconds
+        self.max_per_second = max_per_second
+        self.tag_cooldown = tag_cooldown
+
+        self._entries = []
+        # identical alert key -> the waiting entry new ones get merged into
+        self._coalescing = {}
+        self._tag_last_queued = {}
+        self._seq = itertools.count()
+        self._next_send = 0
+        self._condition = threading.Condition()
+
+        self.sent = 0
+        self.merged = 0
+        self.dropped = Counter()
+
+    def put(self, namespace, data, priority=PRIORITY_DASHBOARD, tag=None, trace=None):
+        """Queues the alert for the overlay, returns whether it was queued (or merged) rather than dropped"""
+        key = (namespace, data.get("text"), data.get("sound"), data.get("effect"), data.get("image"))
+        with self._condition:
+            now = time.monotonic()
+
+            waiting = self._coalescing.get(key)
+            if waiting is not None and now - waiting.enqueued_at <= self.coalesce_seconds:
+                waiting.multiplier += 1
+                waiting.priority = min(waiting.priority, priority)
+                self.merged += 1
+                _finish_trace(trace, "merged")
+                return True
+
+            if tag and self.tag_cooldown and now - self._tag_last_queued.get(tag, float("-inf")) < self.tag_cooldown:
+                return self._drop("tag_cooldown", data, trace)
+
+            if len(self._entries) >= self.max_size:
+                if self.drop_policy == "newest":
+                    return self._drop("full", data, trace)
+                least_important = max(self._entries, key=lambda entry: (entry.priority, entry.seq))
+                if least_important.priority <= priority:
+                    return self._drop("full", data, trace)
+                self._remove(least_important)
+                self._drop("evicted", least_important.data, least_important.trace)
+
+            entry = _Entry(priority, next(self._seq), namespace, dict(data), key, now, trace)
+            self._entries.append(entry)
+            self._coalescing[key] = entry
+            if tag:
+                self._tag_last_queued[tag] = now
+            self._condition.notify()
+        return True
+
+    def get(self, timeout=None):
+        """
+        Waits for the next alert to send, as {"namespace", "data", "trace"}, respecting max_per_second. Returns None
+        if nothing was ready within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._entries and now >= self._next_send:
+                    entry = min(self._entries, key=lambda entry: (entry.priority, entry.seq))
+                    self._remove(entry)
+                    if self.max_per_second:
+                        self._next_send = now + 1 / self.max_per_second
+                    self.sent += 1
+                    return entry.message()
+
+                wait = self._next_send - now if self._entries else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._condition.wait(wait)
+
+    def _remove(self, entry):
+        self._entries.remove(entry)
+        if self._coalescing.get(entry.key) is entry:
+            del self._coalescing[entry.key]
+
+    def _drop(self, reason, data, trace):
+        self.dropped[reason] += 1
+        logger.info(f"Dropped overlay alert ({reason}): {data}")
+        _finish_trace(trace, "dropped")
+        return False
+
+    def stats(self):
+        with self._condition:
+            return {
+                "depth": len(self._entries),
+                "max_size": self.max_size,
+                "sent": self.sent,
+                "merged": self.merged,
+                "dropped": dict(self.dropped),
+            }
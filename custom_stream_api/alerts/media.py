@@ -0,0 +1,201 @@
+"""
+Every sound and image the overlays could be asked to play, so they can fetch them before the first alert
+
+The manifest is versioned by a hash of its urls. Overlays keep the version they last saw and ask for what changed
+since then; whenever an alert write changes the manifest, its new version is pushed over socket.io.
+
+It's loaded from the database on first use. After that, a write only reads the alerts it changed and applies their
+media to the manifest, counting how many alerts use each url so a url shared by several alerts stays until none do.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from urllib.parse import urlparse
+
+from sqlalchemy import select
+
+from custom_stream_api.alerts.models import Alert
+from custom_stream_api.shared import db, get_app
+
+logger = logging.getLogger(__name__)
+
+# how many past versions overlays can still get just the changes from
+HISTORY_SIZE = 20
+SOCKET_EVENT = "MediaManifest"
+NAMESPACES = ["live", "preview"]
+
+Manifest = namedtuple("Manifest", ["version", "media"])
+
+_manifest = None
+# alert name -> its [(url, type)], and how many alerts use each url
+_alert_media = {}
+_url_counts = Counter()
+# version -> every url in it
+_history = OrderedDict()
+# Bumped on every write so a load that raced with it doesn't store what it read
+_generation = 0
+_lock = threading.Lock()
+# writes are applied one at a time, in the order they read the database
+_update_lock = threading.Lock()
+
+
+def _media_entry(url, media_type):
+    extension = os.path.splitext(urlparse(url).path)[1].lstrip(".").lower()
+    return {
+        "url": url,
+        "type": media_type,
+        "format": extension,
+        "mime_type": mimetypes.guess_type(f"media.{extension}")[0],
+    }
+
+
+def _alert_urls(sound, image):
+    return [(url, media_type) for url, media_type in [(sound, "sound"), (image, "image")] if url]
+
+
+def _load(alert_names=None):
+    media_query = select(Alert.name, Alert.sound, Alert.image)
+    if alert_names is not None:
+        media_query = media_query.where(Alert.name.in_(alert_names))
+    return {name: _alert_urls(sound, image) for name, sound, image in db.session.execute(media_query)}
+
+
+def _version(media):
+    return hashlib.sha1("\n".join(sorted(media)).encode()).hexdigest()[:16]
+
+
+def _apply(media, alert_names, found):
+    """Swaps the media of these alerts for what was found for them, in place"""
+    for alert_name in alert_names:
+        for url, _ in _alert_media.pop(alert_name, []):
+            _url_counts[url] -= 1
+            if not _url_counts[url]:
+                del _url_counts[url]
+                del media[url]
+        if alert_name in found:
+            _alert_media[alert_name] = found[alert_name]
+            for url, media_type in found[alert_name]:
+                if not _url_counts[url]:
+                    media[url] = _media_entry(url, media_type)
+                _url_counts[url] += 1
+
+
+def _install(alert_media):
+    global _manifest
+    _alert_media.clear()
+    _url_counts.clear()
+    media = {}
+    _apply(media, list(alert_media), alert_media)
+    _manifest = Manifest(_version(media), media)
+    _remember(_manifest)
+    return _manifest
+
+
+def _remember(manifest):
+    _history[manifest.version] = frozenset(manifest.media)
+    _history.move_to_end(manifest.version)
+    while len(_history) > HISTORY_SIZE:
+        _history.popitem(last=False)
+
+
+def _announce(previous, manifest):
+    if previous is not None and previous.version != manifest.version:
+        app = get_app()
+        socketio_queue = getattr(app, "socketio_queue", None)
+        if socketio_queue:
+            for namespace in NAMESPACES:
+                socketio_queue.sync_q.put(
+                    {"namespace": namespace, "event": SOCKET_EVENT, "data": {"version": manifest.version}}
+                )
+
+
+def get_manifest():
+    manifest = _manifest
+    if manifest is None:
+        generation = _generation
+        alert_media = _load()
+        with _lock:
+            if _manifest is not None:
+                return _manifest
+            if generation == _generation:
+                return _install(alert_media)
+        # a write got in while loading, hand out what was read without keeping it
+        media = {}
+        for alert_name, urls in alert_media.items():
+            for url, media_type in urls:
+                media.setdefault(url, _media_entry(url, media_type))
+        manifest = Manifest(_version(media), media)
+    return manifest
+
+
+def update(alert_names):
+    """Applies the media of just these alerts to the manifest after a write, letting the overlays know if it changed"""
+    global _generation, _manifest
+    alert_names = set(alert_names)
+    if not alert_names:
+        return None
+    with _update_lock:
+        with _lock:
+            _generation += 1
+            if _manifest is None:
+                # the next read loads everything anyway
+                return None
+        found = _load(alert_names)
+        with _lock:
+            _generation += 1
+            previous = _manifest
+            if previous is None:
+                return None
+            media = dict(previous.media)
+            _apply(media, alert_names, found)
+            version = _version(media)
+            if version != previous.version:
+                _manifest = Manifest(version, media)
+                _remember(_manifest)
+            manifest = _manifest
+    _announce(previous, manifest)
+    return manifest
+
+
+def refresh():
+    """Loads the whole manifest again (after an import), letting the overlays know if it changed"""
+    global _generation
+    with _update_lock:
+        alert_media = _load()
+        with _lock:
+            _generation += 1
+            previous = _manifest
+            manifest = _install(alert_media)
+    _announce(previous, manifest)
+    return manifest
+
+
+def changes(since=None):
+    """
+    What changed since the given version: media that was added and urls that were removed. If the version is unknown
+    (or not given), everything is returned as added and full is set.
+    """
+    manifest = get_manifest()
+    with _lock:
+        previous = _history.get(since) if since else None
+    if previous is None:
+        added = [manifest.media[url] for url in sorted(manifest.media)]
+        removed = []
+    else:
+        added = [manifest.media[url] for url in sorted(manifest.media.keys() - previous)]
+        removed = sorted(previous - manifest.media.keys())
+    return {"version": manifest.version, "full": previous is None, "added": added, "removed": removed}
+
+
+def clear():
+    global _manifest, _generation
+    with _lock:
+        _generation += 1
+        _manifest = None
+        _alert_media.clear()
+        _url_counts.clear()
+        _history.clear()
@@ -1,9 +1,11 @@
+from collections import defaultdict
+
 from custom_stream_api.shared import db
 
 from custom_stream_api.shared import Base
 from sqlalchemy.sql import func
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, UniqueConstraint, Boolean, Text
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, UniqueConstraint, Boolean, Text
 from sqlalchemy.orm import relationship
 
 
@@ -20,16 +22,10 @@ class Alert(Base):
 
     tags = relationship("TagAssociation", cascade="all,delete", backref="alert")
 
+    __table_args__ = (Index("ix_alert_created_at_name", "created_at", "name"),)
+
     def as_dict(self):
-        alert_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        tags_query = (
-            db.session.query(Tag.name)
-            .join(TagAssociation)
-            .filter(TagAssociation.alert_name == alert_dict["name"])
-            .order_by(Tag.name)
-        )
-        alert_dict["tags"] = [result[0] for result in tags_query]
-        return alert_dict
+        return _serialize(Alert, [self])[0]
 
 
 class Tag(Base):
@@ -47,16 +43,10 @@ class Tag(Base):
 
     alerts = relationship("TagAssociation", cascade="all,delete", backref="tag")
 
+    __table_args__ = (Index("ix_tag_created_at_name", "created_at", "name"),)
+
     def as_dict(self):
-        tag_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        alerts_query = (
-            db.session.query(Alert.name)
-            .join(TagAssociation)
-            .filter(TagAssociation.tag_name == tag_dict["name"])
-            .order_by(Alert.name)
-        )
-        tag_dict["alerts"] = [result[0] for result in alerts_query]
-        return tag_dict
+        return _serialize(Tag, [self])[0]
 
 
 class TagAssociation(Base):
@@ -65,3 +55,55 @@ class TagAssociation(Base):
     tag_name = Column(Text, ForeignKey("tag.name", ondelete="CASCADE"), nullable=False)
     alert_name = Column(Text, ForeignKey("alert.name", ondelete="CASCADE"), nullable=False)
     __table_args__ = (UniqueConstraint("tag_name", "alert_name", name="_tag_uc"),)
+
+
+class Usage(Base):
+    __tablename__ = "usage"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    result_type = Column(Text, nullable=False)  # Alert or Tag
+    name = Column(Text, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    # log of the exponentially decayed trigger count, see custom_stream_api.alerts.usage
+    score = Column(Float, nullable=False)
+    last_used_at = Column(DateTime(timezone=True))
+    __table_args__ = (
+        UniqueConstraint("result_type", "name", name="_usage_uc"),
+        Index("ix_usage_popularity", "result_type", "score"),
+    )
+
+
+# BULK SERIALIZING
+# Associations for every object are loaded in one query instead of one per object
+
+
+def _serialize(model, objs):
+    if model is Alert:
+        key, other, field = TagAssociation.alert_name, TagAssociation.tag_name, "tags"
+    else:
+        key, other, field = TagAssociation.tag_name, TagAssociation.alert_name, "alerts"
+
+    names = [obj.name for obj in objs]
+    associations = defaultdict(list)
+    if names:
+        associations_query = db.session.query(key, other).filter(key.in_(names)).order_by(other)
+        for name, other_name in associations_query:
+            associations[name].append(other_name)
+
+    serialized = []
+    for obj in objs:
+        obj_dict = {c.name: getattr(obj, c.name) for c in model.__table__.columns}
+        obj_dict[field] = associations[obj.name]
+        serialized.append(obj_dict)
+    return serialized
+
+
+def serialize_alerts(names):
+    """Alert dicts for the given names, in the same order, skipping any that don't exist. Two queries total."""
+    found_alerts = {alert.name: alert for alert in db.session.query(Alert).filter(Alert.name.in_(names))}
+    return _serialize(Alert, [found_alerts[name] for name in dict.fromkeys(names) if name in found_alerts])
+
+
+def serialize_tags(names):
+    """Tag dicts for the given names, in the same order, skipping any that don't exist. Two queries total."""
+    found_tags = {tag.name: tag for tag in db.session.query(Tag).filter(Tag.name.in_(names))}
+    return _serialize(Tag, [found_tags[name] for name in dict.fromkeys(names) if name in found_tags])
@@ -0,0 +1,291 @@
+"""
+In-memory search over alerts and tags for browse(search=...)
+
+Every word of an alert's name and text and a tag's name and display name is indexed by each of its beginnings, so a
+lookup is a couple of dict hits no matter how big the catalog is. Whole words rank above their beginnings. Like browse
+always has, the search also matches anywhere in the names: those are indexed by their trigrams, and the few names
+sharing all of the search's trigrams are checked for it. Searches shorter than a trigram look through the names only
+when they have no words to look up.
+
+The index is loaded in the background when the server starts (or by the first search otherwise). After that, writes
+update the entries of just the alerts and tags they changed.
+"""
+
+import logging
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import or_
+
+from custom_stream_api.alerts import usage
+from custom_stream_api.alerts.models import Alert, Tag, TagAssociation
+from custom_stream_api.shared import db, run_async_in_thread
+
+logger = logging.getLogger(__name__)
+
+Entry = namedtuple("Entry", ["name", "thumbnail", "result_type", "display_name", "created_at", "category"])
+
+# how much a matching word counts towards relevance, by where it was found
+NAME_WEIGHT = 3
+DISPLAY_NAME_WEIGHT = 2
+TEXT_WEIGHT = 1
+# the whole word matching counts for more than its beginning
+EXACT_BONUS = 2
+# names are indexed by their substrings of this length
+NGRAM_SIZE = 3
+
+# browse tiers: tags > matched alerts > alerts from matched tags
+TAG_PRIORITY = 0
+ALERT_PRIORITY = 1
+EXPLODED_PRIORITY = 2
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+def _standardize(name):
+    # alerts.standardize_name, which imports this module
+    return re.sub(r"[^\w\d]", "", re.sub(r"\s|-", "_", name.strip().lower()))
+
+
+def ngrams(text):
+    return {text[start : start + NGRAM_SIZE] for start in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.entries = {}
+        # term -> {(result_type, name): weight}, a term being the beginning of a word
+        self.terms = defaultdict(dict)
+        # (result_type, name) -> the terms it's indexed under, to remove it again
+        self.entry_terms = {}
+        # trigram -> {(result_type, name)} of the names containing it
+        self.name_ngrams = defaultdict(set)
+        # tag name -> alert names and back
+        self.tag_alerts = defaultdict(set)
+        self.alert_tags = defaultdict(set)
+
+    def add(self, entry, weighted_fields):
+        key = (entry.result_type, entry.name)
+        self.remove(key)
+        self.entries[key] = entry
+        entry_terms = self.entry_terms[key] = set()
+        for text, weight in weighted_fields:
+            for token in tokenize(text):
+                for end in range(1, len(token) + 1):
+                    term = token[:end]
+                    score = weight * (EXACT_BONUS if end == len(token) else 1)
+                    if score > self.terms[term].get(key, 0):
+                        self.terms[term][key] = score
+                    entry_terms.add(term)
+        for ngram in ngrams(entry.name.lower()):
+            self.name_ngrams[ngram].add(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        for term in self.entry_terms.pop(key, []):
+            self.terms[term].pop(key, None)
+            if not self.terms[term]:
+                del self.terms[term]
+        if entry is not None:
+            for ngram in ngrams(entry.name.lower()):
+                self.name_ngrams[ngram].discard(key)
+                if not self.name_ngrams[ngram]:
+                    del self.name_ngrams[ngram]
+
+    def associate(self, tag_name, alert_name):
+        self.tag_alerts[tag_name].add(alert_name)
+        self.alert_tags[alert_name].add(tag_name)
+
+    def remove_alert(self, alert_name):
+        self.remove(("Alert", alert_name))
+        for tag_name in self.alert_tags.pop(alert_name, []):
+            self.tag_alerts[tag_name].discard(alert_name)
+
+    def remove_tag(self, tag_name):
+        self.remove(("Tag", tag_name))
+        for alert_name in self.tag_alerts.pop(tag_name, []):
+            self.alert_tags[alert_name].discard(tag_name)
+
+    def match_names(self, needle, scan=False):
+        """Every entry with the needle in its name. Needles shorter than a trigram are only looked for if scan"""
+        if len(needle) < NGRAM_SIZE:
+            candidates = self.entries if scan else []
+        else:
+            postings = sorted((self.name_ngrams.get(ngram, set()) for ngram in ngrams(needle)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return [key for key in candidates if needle in key[1].lower()]
+
+    def match(self, search):
+        """Every entry matching all of the words in the search, or having it in its name, with its relevance score"""
+        tokens = tokenize(search)
+        scores = {}
+        if tokens:
+            candidates = sorted((self.terms.get(token, {}) for token in tokens), key=len)
+            scores = dict(candidates[0])
+            for candidate in candidates[1:]:
+                scores = {key: score + candidate[key] for key, score in scores.items() if key in candidate}
+        # with nothing to look up, look for it in the names like a plain substring search
+        for key in self.match_names(_standardize(search or ""), scan=not tokens):
+            scores.setdefault(key, NAME_WEIGHT)
+        return scores
+
+
+_index = None
+_lock = threading.Lock()
+# writes (and the build) are applied one at a time, in the order they read the database
+_update_lock = threading.Lock()
+
+
+def _alerts_query():
+    return db.session.query(Alert.name, Alert.thumbnail, Alert.text, Alert.created_at)
+
+
+def _tags_query():
+    return db.session.query(Tag.name, Tag.thumbnail, Tag.display_name, Tag.created_at, Tag.category)
+
+
+def _add_alert(index, alert):
+    entry = Entry(alert.name, alert.thumbnail, "Alert", alert.text, alert.created_at, None)
+    index.add(entry, [(alert.name, NAME_WEIGHT), (alert.text, TEXT_WEIGHT)])
+
+
+def _add_tag(index, tag):
+    entry = Entry(tag.name, tag.thumbnail, "Tag", tag.display_name, tag.created_at, tag.category)
+    index.add(entry, [(tag.name, NAME_WEIGHT), (tag.display_name, DISPLAY_NAME_WEIGHT)])
+
+
+def build():
+    """
+    Loads the whole catalog into a new index and makes it current. Writes wait for it and are applied on top, so
+    nothing committed while it was loading is missed.
+    """
+    global _index
+    with _update_lock:
+        # a search that was waiting on a build in progress doesn't need another one
+        if _index is not None:
+            return _index
+        index = SearchIndex()
+
+        for alert in _alerts_query():
+            _add_alert(index, alert)
+        for tag in _tags_query():
+            _add_tag(index, tag)
+        for tag_name, alert_name in db.session.query(TagAssociation.tag_name, TagAssociation.alert_name):
+            index.associate(tag_name, alert_name)
+
+        with _lock:
+            _index = index
+        return index
+
+
+def get_index():
+    return _index or build()
+
+
+async def build_in_background(app):
+    with app.flask_app.app_context():
+        try:
+            build()
+        except Exception as e:
+            logger.exception(e)
+
+
+def run_index_builder(app):
+    """Builds the index in the background, so starting the server doesn't wait on it"""
+    run_async_in_thread(build_in_background, app)
+
+
+def update(alert_names=(), tag_names=()):
+    """
+    Reloads the entries and associations of just these alerts and tags after a write. Ones that don't exist anymore
+    are removed.
+    """
+    alert_names = set(alert_names)
+    tag_names = set(tag_names)
+    if not alert_names and not tag_names:
+        return
+    with _update_lock:
+        if _index is None:
+            # the next build loads everything anyway
+            return
+
+        found_alerts = _alerts_query().filter(Alert.name.in_(alert_names)).all() if alert_names else []
+        found_tags = _tags_query().filter(Tag.name.in_(tag_names)).all() if tag_names else []
+        associations = db.session.query(TagAssociation.tag_name, TagAssociation.alert_name).filter(
+            or_(TagAssociation.alert_name.in_(alert_names), TagAssociation.tag_name.in_(tag_names))
+        )
+        associations = associations.all()
+
+        with _lock:
+            for alert_name in alert_names:
+                _index.remove_alert(alert_name)
+            for tag_name in tag_names:
+                _index.remove_tag(tag_name)
+            for alert in found_alerts:
+                _add_alert(_index, alert)
+            for tag in found_tags:
+                _add_tag(_index, tag)
+            for tag_name, alert_name in associations:
+                _index.associate(tag_name, alert_name)
+
+
+def invalidate():
+    """Throws the whole index away, the next search loads it again"""
+    global _index
+    with _update_lock, _lock:
+        _index = None
+
+
+def search(search, sort="name", include_alerts=True, include_tags=True, tag_category=None):
+    """
+    Ranked browse results for the search as (priority, score, entry), best first. Within a tier, more relevant
+    results come first, then the usual sort.
+    """
+    index = get_index()
+    # writes change the index in place, so read it under the lock
+    with _lock:
+        scores = index.match(search)
+
+        results = {}
+        if include_tags or not include_alerts:
+            for key, score in scores.items():
+                entry = index.entries[key]
+                if entry.result_type == "Tag" and (not tag_category or entry.category == tag_category):
+                    results[key] = (TAG_PRIORITY, score, entry)
+        if include_alerts:
+            for key, score in scores.items():
+                if key[0] == "Alert":
+                    results[key] = (ALERT_PRIORITY, score, index.entries[key])
+            # when a tag matches, include all the alerts associated with it
+            for key, score in scores.items():
+                if key[0] != "Tag":
+                    continue
+                for alert_name in index.tag_alerts.get(key[1], []):
+                    alert_key = ("Alert", alert_name)
+                    if alert_key not in index.entries:
+                        continue
+                    # an alert only shows up once, where it ranks highest
+                    found = results.get(alert_key)
+                    if found is None or (found[0] == EXPLODED_PRIORITY and found[1] < score):
+                        results[alert_key] = (EXPLODED_PRIORITY, score, index.entries[alert_key])
+
+    sort = sort or "name"
+    sort_column = sort.lstrip("-")
+    ranked = sorted(results.values(), key=lambda result: result[2].name)
+    if sort_column == "popular":
+        popularity = {}
+        for result_type in ["Alert", "Tag"]:
+            names = [entry.name for _, _, entry in results.values() if entry.result_type == result_type]
+            for name, score in usage.scores(result_type, names).items():
+                popularity[(result_type, name)] = score
+        ranked.sort(
+            key=lambda result: popularity.get((result[2].result_type, result[2].name), float("-inf")),
+            reverse=sort[0] != "-",
+        )
+    else:
+        ranked.sort(key=lambda result: getattr(result[2], sort_column), reverse=sort[0] == "-")
+    ranked.sort(key=lambda result: (result[0], -result[1]))
+    return ranked
@@ -0,0 +1,158 @@
+"""
+How often alerts and tags get triggered, for sorting browse by popularity
+
+Triggers are only counted in memory; a background thread flushes them every FLUSH_INTERVAL seconds in one upsert.
+
+Besides the all-time total, each row keeps a score that decays by half every HALF_LIFE so recently used sounds float
+to the top. To keep scores comparable without rewriting every row as time passes, each trigger is weighted by how far
+after EPOCH it happened (exp((t - EPOCH) / TAU)) and the score is stored as the log of the sum of those weights. A
+higher stored score is always the more popular one, so the popularity index can be used as is.
+"""
+
+import asyncio
+import atexit
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from custom_stream_api.alerts.models import Usage
+from custom_stream_api.shared import bump_version, db, run_async_in_thread
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 30  # seconds
+HALF_LIFE = 7 * 24 * 60 * 60  # seconds
+TAU = HALF_LIFE / math.log(2)
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+# past this, adding the smaller score doesn't change the bigger one anyway (and exp() would underflow)
+MAX_SCORE_GAP = 50
+
+# (result_type, name) -> [total, score, last_used_at]
+_pending = {}
+_lock = threading.Lock()
+
+
+def _log_add(a, b):
+    """log(exp(a) + exp(b)) without leaving log space"""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(-min(high - low, MAX_SCORE_GAP)))
+
+
+def _weight(timestamp):
+    return (timestamp - EPOCH) / TAU
+
+
+def record(result_type, name):
+    """Counts a trigger, nothing is written until the next flush"""
+    now = time.time()
+    with _lock:
+        pending = _pending.get((result_type, name))
+        if pending is None:
+            _pending[(result_type, name)] = [1, _weight(now), now]
+        else:
+            pending[0] += 1
+            pending[1] = _log_add(pending[1], _weight(now))
+            pending[2] = now
+
+
+def _merge(pending):
+    with _lock:
+        for key, (total, score, last_used_at) in pending.items():
+            current = _pending.get(key)
+            if current is None:
+                _pending[key] = [total, score, last_used_at]
+            else:
+                current[0] += total
+                current[1] = _log_add(current[1], score)
+                current[2] = max(current[2], last_used_at)
+
+
+def flush():
+    """Writes every pending trigger in one upsert, returns how many rows were written"""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+
+    rows = [
+        {
+            "result_type": result_type,
+            "name": name,
+            "total": total,
+            "score": score,
+            "last_used_at": datetime.fromtimestamp(last_used_at, timezone.utc),
+        }
+        for (result_type, name), (total, score, last_used_at) in sorted(pending.items())
+    ]
+    statement = insert(Usage).values(rows)
+    excluded = statement.excluded
+    gap = func.least(func.abs(Usage.score - excluded.score), MAX_SCORE_GAP)
+    statement = statement.on_conflict_do_update(
+        constraint="_usage_uc",
+        set_={
+            "total": Usage.total + excluded.total,
+            "score": func.greatest(Usage.score, excluded.score) + func.ln(1 + func.exp(-gap)),
+            "last_used_at": func.greatest(Usage.last_used_at, excluded.last_used_at),
+        },
+    )
+    try:
+        db.session.execute(statement)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # keep them for the next flush
+        _merge(pending)
+        raise
+    # browsing by popularity changed
+    bump_version("alerts")
+    return len(rows)
+
+
+def decayed_score(score, at=None):
+    """The stored score as a decayed trigger count at the given time (now by default)"""
+    at = time.time() if at is None else at
+    return math.exp(score - _weight(at))
+
+
+def scores(result_type, names):
+    """Stored scores for the given names, names that were never triggered are left out"""
+    if not names:
+        return {}
+    scores_query = select(Usage.name, Usage.score).where(Usage.result_type == result_type, Usage.name.in_(names))
+    return dict(db.session.execute(scores_query).all())
+
+
+def remove(result_type, name):
+    with _lock:
+        _pending.pop((result_type, name), None)
+    db.session.query(Usage).filter_by(result_type=result_type, name=name).delete()
+
+
+def clear():
+    with _lock:
+        _pending.clear()
+
+
+async def flush_in_background(app):
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        with app.flask_app.app_context():
+            try:
+                flush()
+            except Exception as e:
+                logger.exception(e)
+
+
+def run_usage_flusher(app):
+    def flush_on_exit():
+        with app.flask_app.app_context():
+            flush()
+
+    atexit.register(flush_on_exit)
+    run_async_in_thread(flush_in_background, app)
@@ -5,8 +5,8 @@ from flask import jsonify
 from webargs import fields, validate
 from webargs.flaskparser import use_kwargs
 
-from custom_stream_api.alerts import alerts
-from custom_stream_api.shared import InvalidUsage
+from custom_stream_api.alerts import alerts, media
+from custom_stream_api.shared import InvalidUsage, conditional_get
 from custom_stream_api.auth import twitch_auth
 
 alert_endpoints = Blueprint("alerts", __name__)
@@ -16,10 +16,12 @@ logger = logging.getLogger(__name__)
 
 @alert_endpoints.route("/", methods=["GET"])
 @twitch_auth.twitch_login_required
+@conditional_get("alerts")
 @use_kwargs(
     {
         "sort": fields.Str(
-            validate=validate.OneOf(["name", "created_at", "-name", "-created_at"]), load_default="-created_at"
+            validate=validate.OneOf(["name", "created_at", "popular", "-name", "-created_at", "-popular"]),
+            load_default="-created_at",
         ),
         "page": fields.Int(validate=lambda val: val > 0, load_default=1),
         "limit": fields.Int(validate=lambda val: val > 0, load_default=alerts.MAX_LIMIT),
@@ -27,6 +29,8 @@ logger = logging.getLogger(__name__)
         "search": fields.Str(load_default=""),
         "include_alerts": fields.Bool(load_default=True),
         "include_tags": fields.Bool(load_default=True),
+        "cursor": fields.Str(load_default=None),
+        "include_total": fields.Bool(load_default=True),
     },
     location="query",
 )
@@ -41,6 +45,7 @@ def browse_get(**kwargs):
 
 @alert_endpoints.route("/alert_details", methods=["GET"])
 @twitch_auth.twitch_login_required
+@conditional_get("alerts")
 @use_kwargs(
     {
         "name": fields.Str(required=True),
@@ -56,6 +61,23 @@ def alert_details_get(**kwargs):
     return jsonify({"alert": alert})
 
 
+@alert_endpoints.route("/media_manifest", methods=["GET"])
+@twitch_auth.twitch_login_required
+@use_kwargs(
+    {
+        "since": fields.Str(load_default=None),
+    },
+    location="query",
+)
+def media_manifest_get(**kwargs):
+    try:
+        manifest_changes = media.changes(**kwargs)
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    return jsonify(manifest_changes)
+
+
 @alert_endpoints.route("/save_alert", methods=["POST"])
 @twitch_auth.twitch_login_required
 @use_kwargs(
@@ -79,6 +101,24 @@ def save_alert_post(**kwargs):
     return jsonify({"message": f"Alert saved: {alert.name}"})
 
 
+@alert_endpoints.route("/import", methods=["POST"])
+@twitch_auth.twitch_login_required
+@use_kwargs(
+    {
+        "alerts": fields.List(fields.Dict(), load_default=[]),
+        "tags": fields.List(fields.Dict(), load_default=[]),
+    },
+    location="json",
+)
+def import_alerts_post(**kwargs):
+    try:
+        import_results = alerts.import_alerts(**kwargs)
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    return jsonify(import_results)
+
+
 @alert_endpoints.route("/alert", methods=["POST"])
 @twitch_auth.twitch_login_required
 @use_kwargs(
@@ -137,6 +177,7 @@ def tag_alert_post(**kwargs):
 
 @alert_endpoints.route("/tag_details", methods=["GET"])
 @twitch_auth.twitch_login_required
+@conditional_get("alerts")
 @use_kwargs(
     {
         "name": fields.Str(required=True),
@@ -0,0 +1,34 @@
+"""
+Backing up and restoring from the command line, without the server running
+
+    python -m custom_stream_api.backup export > backup.ndjson
+    python -m custom_stream_api.backup import < backup.ndjson
+"""
+
+import argparse
+import sys
+
+from custom_stream_api.backup import backup
+from custom_stream_api.shared import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m custom_stream_api.backup")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("file", nargs="?", help="defaults to stdout for export, stdin for import")
+    args = parser.parse_args()
+
+    app, _, _ = create_app()
+    with app.flask_app.app_context():
+        if args.command == "export":
+            with open(args.file, "w") if args.file else sys.stdout as export_file:
+                export_file.writelines(backup.export_lines())
+        else:
+            with open(args.file) if args.file else sys.stdin as import_file:
+                imported = backup.import_lines(import_file)
+            for table_name, row_count in imported.items():
+                print(f"{table_name}: {row_count}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+The whole stream setup (alerts, tags, counts, lists, aliases, timers and bans) as newline delimited JSON
+
+An export is a header line followed by one {"type": table name, "data": row} line per row, table by table in the order
+of MODELS so everything a row refers to comes before it. Ids are left out, rows refer to each other by name.
+
+Importing replaces the whole setup in a single transaction. Rows are inserted in chunks as the lines stream in, so
+neither side ever holds the whole setup in memory. Exports from older versions are upgraded as they're read.
+"""
+
+import json
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import DateTime, delete, func, insert, select, update
+
+from custom_stream_api.alerts import cache, media, search
+from custom_stream_api.alerts.models import Alert, Tag, TagAssociation
+from custom_stream_api.chatbot import bans, timers
+from custom_stream_api.chatbot.models import Alias, BannedUser, Timer
+from custom_stream_api.counts import counts
+from custom_stream_api.counts.models import Count
+from custom_stream_api.lists import lists
+from custom_stream_api.lists.models import List, ListItem
+from custom_stream_api.shared import bump_version, db, get_app
+
+# 2: lists have their size and list items their position
+# 3: banned chatters have their own rows instead of being the banned_users list
+FORMAT_VERSION = 3
+# the list bans were kept in before version 3
+BANNED_USERS_LIST = "banned_users"
+# rows are written, and need to be read, in this order
+MODELS = [Alert, Tag, TagAssociation, Count, List, ListItem, Alias, Timer, BannedUser]
+MODELS_BY_TYPE = {model.__tablename__: model for model in MODELS}
+CHUNK_SIZE = 1000
+
+
+def _columns(model):
+    return [column for column in model.__table__.columns if column.name != "id"]
+
+
+def _dump_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_lines():
+    """Yields the export line by line, reading each table through a server side cursor"""
+    # count changes still waiting in the write-behind buffer are part of the setup too
+    counts.flush()
+    yield json.dumps({"type": "header", "version": FORMAT_VERSION}) + "\n"
+    for model in MODELS:
+        columns = _columns(model)
+        rows_query = select(*columns).order_by(model.id).execution_options(yield_per=CHUNK_SIZE)
+        for row in db.session.execute(rows_query):
+            data = {column.name: _dump_value(value) for column, value in zip(columns, row)}
+            yield json.dumps({"type": model.__tablename__, "data": data}) + "\n"
+
+
+def _load_row(model, data, line_number):
+    if not isinstance(data, dict):
+        raise Exception(f"Line {line_number}: data must be an object")
+    row = {}
+    for key, value in data.items():
+        column = model.__table__.columns.get(key)
+        if column is None or key == "id":
+            raise Exception(f"Line {line_number}: unknown {model.__tablename__} field: {key}")
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[key] = value
+    return row
+
+
+def _upgrade_row(version, model, row, positions, banned):
+    """Fills in what rows from an older export don't have, returns None for rows that are now kept elsewhere"""
+    if version < 3:
+        if model is List and row.get("name") == BANNED_USERS_LIST:
+            return None
+        if model is ListItem and row.get("list_name") == BANNED_USERS_LIST:
+            banned.append(row.get("item"))
+            return None
+    if version < 2:
+        if model is List:
+            # counted once all the items are in
+            row["size"] = 0
+        elif model is ListItem:
+            # items were exported in their list's order
+            positions[row["list_name"]] += 1
+            row["position"] = positions[row["list_name"]]
+    return row
+
+
+def _upgrade_setup(version, banned):
+    """Fixes up what can only be known once an older export is all in, returns how many bans were converted"""
+    if version < 2:
+        list_size = select(func.count()).where(ListItem.list_name == List.name).scalar_subquery()
+        db.session.execute(update(List).values(size=list_size))
+    banned_rows = [{"name": name} for name in dict.fromkeys(banned) if name]
+    if banned_rows:
+        db.session.execute(insert(BannedUser), banned_rows)
+    return len(banned_rows)
+
+
+def _insert_chunk(model, rows):
+    if rows:
+        db.session.execute(insert(model), rows)
+
+
+def _setup_changed():
+    """Drops everything derived from the old setup after an import"""
+    cache.clear()
+    search.invalidate()
+    media.refresh()
+    bans.invalidate()
+    lists.invalidate_names()
+    # deltas buffered before the import would otherwise be added on top of the imported counts
+    counts.clear_pending()
+    for resource in ["alerts", "counts", "lists", "aliases", "timers", "bans"]:
+        bump_version(resource)
+
+    app = get_app()
+    for bot_name in timers.SUPPORTED_BOTS.values():
+        bot = getattr(app, bot_name, None)
+        if bot:
+            bot.update_commands()
+    timers.ping_scheduler()
+
+
+def import_lines(lines):
+    """
+    Replaces the whole setup with the export in lines (str or bytes, e.g. a file or a request stream). Returns how many
+    rows of each type were imported.
+    """
+    imported = Counter()
+    version = None
+    model = None
+    rows = []
+    positions = defaultdict(int)
+    banned = []
+    # a savepoint, so a bad line undoes everything without throwing away the rest of the session
+    with db.session.begin_nested():
+        for line_number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode()
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                record_type = record["type"]
+            except (ValueError, TypeError, KeyError):
+                raise Exception(f"Line {line_number}: not an export line")
+
+            if version is None:
+                if record_type != "header":
+                    raise Exception("Not an export, the first line must be its header")
+                version = record.get("version")
+                if not isinstance(version, int) or not 1 <= version <= FORMAT_VERSION:
+                    raise Exception(f"Unsupported export version: {version}")
+                for clearing_model in reversed(MODELS):
+                    db.session.execute(delete(clearing_model))
+                continue
+
+            record_model = MODELS_BY_TYPE.get(record_type)
+            if record_model is None:
+                raise Exception(f"Line {line_number}: unknown type: {record_type}")
+            if record_model is not model:
+                if model is not None and MODELS.index(record_model) < MODELS.index(model):
+                    raise Exception(f"Line {line_number}: {record_type} rows must come before {model.__tablename__}")
+                _insert_chunk(model, rows)
+                model, rows = record_model, []
+
+            row = _upgrade_row(version, model, _load_row(model, record.get("data"), line_number), positions, banned)
+            if row is None:
+                continue
+            rows.append(row)
+            imported[record_type] += 1
+            if len(rows) >= CHUNK_SIZE:
+                _insert_chunk(model, rows)
+                rows = []
+
+        if version is None:
+            raise Exception("Not an export, the first line must be its header")
+        _insert_chunk(model, rows)
+        imported[BannedUser.__tablename__] += _upgrade_setup(version, banned)
+    db.session.commit()
+
+    _setup_changed()
+    return {model.__tablename__: imported[model.__tablename__] for model in MODELS}
@@ -0,0 +1,33 @@
+import logging
+
+from flask import Blueprint, Response, request, stream_with_context
+from flask import jsonify
+
+from custom_stream_api.backup import backup
+from custom_stream_api.shared import InvalidUsage
+from custom_stream_api.auth import twitch_auth
+
+backup_endpoints = Blueprint("backup", __name__)
+
+logger = logging.getLogger(__name__)
+
+
+@backup_endpoints.route("/export", methods=["GET"])
+@twitch_auth.twitch_login_required
+def export_get():
+    return Response(
+        stream_with_context(backup.export_lines()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=custom_stream_api.ndjson"},
+    )
+
+
+@backup_endpoints.route("/import", methods=["POST"])
+@twitch_auth.twitch_login_required
+def import_post():
+    try:
+        imported = backup.import_lines(request.stream)
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    return jsonify({"imported": imported})
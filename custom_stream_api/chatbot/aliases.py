@@ -1,5 +1,5 @@
 from custom_stream_api.chatbot.models import Alias, BADGE_NAMES
-from custom_stream_api.shared import db, get_app
+from custom_stream_api.shared import bump_version, db, get_app
 
 
 def list_aliases():
@@ -18,6 +18,7 @@ def add_alias(alias, command, badge, save=True):
         db.session.add(new_alias)
     if save:
         db.session.commit()
+        bump_version("aliases")
 
         app = get_app()
         twitch_chatbot = getattr(app, "twitch_chatbot", None)
@@ -31,6 +32,7 @@ def remove_alias(alias):
     if found_alias.count():
         found_alias.delete()
         db.session.commit()
+        bump_version("aliases")
 
         app = get_app()
         twitch_chatbot = getattr(app, "twitch_chatbot", None)
@@ -0,0 +1,76 @@
+"""
+Chatters who can't trigger alerts
+
+Every alert command checks the chatter, so the banned names are kept in a set in memory, read from the database the
+first time they're needed and thrown away whenever someone is banned or unbanned.
+"""
+
+import threading
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from custom_stream_api.chatbot.models import BannedUser
+from custom_stream_api.shared import bump_version, db
+
+_banned = None
+_lock = threading.Lock()
+# bumped on every ban or unban, a set read from before one of them is never kept
+_generation = 0
+
+
+def _banned_names():
+    global _banned
+    with _lock:
+        if _banned is not None:
+            return _banned
+        generation = _generation
+    banned = frozenset(db.session.scalars(select(BannedUser.name)))
+    with _lock:
+        if generation == _generation:
+            _banned = banned
+    return banned
+
+
+def invalidate():
+    global _banned, _generation
+    with _lock:
+        _banned = None
+        _generation += 1
+
+
+def is_banned(name):
+    return name in _banned_names()
+
+
+def list_bans():
+    return sorted(_banned_names())
+
+
+def ban(names, save=True):
+    """Bans every name in one statement, returns the ones that weren't banned already"""
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return []
+    statement = insert(BannedUser).values([{"name": name} for name in names])
+    statement = statement.on_conflict_do_nothing(index_elements=["name"]).returning(BannedUser.name)
+    banned = set(db.session.scalars(statement))
+    if save:
+        db.session.commit()
+        bump_version("bans")
+    invalidate()
+    return [name for name in names if name in banned]
+
+
+def unban(names, save=True):
+    """Unbans every name in one statement, returns the ones that were banned"""
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return []
+    statement = delete(BannedUser).where(BannedUser.name.in_(names)).returning(BannedUser.name)
+    unbanned = set(db.session.scalars(statement))
+    if save:
+        db.session.commit()
+        bump_version("bans")
+    invalidate()
+    return [name for name in names if name in unbanned]
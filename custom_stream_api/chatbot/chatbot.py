@@ -14,10 +14,11 @@ from functools import partial
 from custom_stream_api import settings
 from custom_stream_api.shared import get_app, APP_DIR
 from custom_stream_api.chatbot.models import Badges, BADGE_LEVELS, BADGE_NAMES
-from custom_stream_api.chatbot import aliases, timers
+from custom_stream_api.chatbot import aliases, bans, timers
 from custom_stream_api.counts import counts
 from custom_stream_api.lists import lists
-from custom_stream_api.alerts import alerts
+from custom_stream_api.alerts import alerts, dispatcher
+from custom_stream_api.metrics import latency
 
 # from custom_stream_api.lights import lights
 
@@ -47,8 +48,9 @@ class ChatBot:
 
     def _substitute_vars(self, message, user=None):
         # edit message to replace variables in braces {}
-        for variable in re.findall("{(.*?)}", message):
-            variable = variable.strip()
+        variables = [variable.strip() for variable in re.findall("{(.*?)}", message)]
+        found_counts = counts.get_counts(variables)
+        for variable in variables:
 
             # {user} -> username of the person saying it
             if variable == "user" and user:
@@ -56,7 +58,7 @@ class ChatBot:
 
             # if it's a count name, return the count
             # {count_name} -> [count number]
-            found_count = counts.get_count(variable)
+            found_count = found_counts.get(variable)
             if found_count is not None:
                 message = message.replace(f"{{{variable}}}", str(found_count))
                 continue
@@ -69,7 +71,7 @@ class ChatBot:
             if len(list_params) > 1:
                 list_name = list_params[0]
                 list_index = list_params[1]
-                if list_name not in [list_dict["name"] for list_dict in lists.list_lists()]:
+                if not lists.list_exists(list_name):
                     logger.info(f"List not found in variable: {list_name}")
                     continue
 
@@ -94,6 +96,9 @@ class ChatBot:
                     self.do_command(message, user, badges)
             except Exception as e:
                 logger.exception(e)
+        # if the command queued an alert, the socket.io emitter finishes the trace instead. Anything else that didn't
+        # look up an alert isn't recorded
+        latency.end_trace()
 
     def get_badge(self, badge_string):
         badge_objects = list(filter(lambda badge: badge.value == badge_string, list(Badges)))
@@ -128,6 +133,7 @@ class ChatBot:
         # allows for updating aliases on the fly without needing to redeploy
         self.set_aliases()
         self.commands.update(self.aliases)
+        latency.mark("aliases")
 
         found_command = self.commands.get(command_name, None)
         if not found_command:
@@ -141,6 +147,7 @@ class ChatBot:
             self.chat(f"Format: {found_command['help']}")
             return
 
+        latency.mark("command")
         found_command["callback"](command_text, user, badges)
 
     # COMMANDS
@@ -497,7 +504,7 @@ class ChatBot:
         }
 
     def list_lists(self):
-        all_lists = ", ".join([count["name"] for count in lists.list_lists()])
+        all_lists = ", ".join(lists.list_names())
         if all_lists:
             self.chat("Lists: {}".format(all_lists))
 
@@ -569,7 +576,7 @@ class ChatBot:
         }
 
     def alert_api(self, user, badges, text):
-        if user in lists.get_list("banned_users"):
+        if bans.is_banned(user):
             return
         elif not self._badge_check(badges, Badges.VIP) and self.spamming(user):
             self.chat("No spamming {}. Wait another {} seconds.".format(user, self.timeout))
@@ -580,7 +587,7 @@ class ChatBot:
         display_text = " ".join(text_args[1:]) if len(text_args) > 1 else None
 
         try:
-            alert_data = alerts.alert(name=alert_name, chat=display_text)
+            alert_data = alerts.alert(name=alert_name, chat=display_text, priority=dispatcher.PRIORITY_CHAT)
         except Exception:
             alert_data = None
 
@@ -588,7 +595,7 @@ class ChatBot:
             self.chat(alert_data["sound"])
 
     def tag_alert_api(self, user, badges, text):
-        if user in lists.get_list("banned_users"):
+        if bans.is_banned(user):
             return
         elif not self._badge_check(badges, Badges.VIP) and self.spamming(user):
             self.chat("No spamming {}. Wait another {} seconds.".format(user, self.timeout))
@@ -599,7 +606,7 @@ class ChatBot:
         display_text = " ".join(text_args[1:]) if len(text_args) > 1 else None
 
         try:
-            alert_data = alerts.tag_alert(name=tag_name, chat=display_text)
+            alert_data = alerts.tag_alert(name=tag_name, chat=display_text, priority=dispatcher.PRIORITY_CHAT)
         except Exception:
             alert_data = None
 
@@ -608,14 +615,13 @@ class ChatBot:
 
     def ban(self, ban_user):
         if ban_user:
-            lists.add_to_list("banned_users", [ban_user])
+            bans.ban([ban_user])
             self.chat("Banned {}".format(ban_user))
             return ban_user
 
     def unban(self, unban_user):
         if unban_user:
-            banned_users = lists.get_list("banned_users")
-            lists.set_list("banned_users", [user for user in banned_users if user != unban_user])
+            bans.unban([unban_user])
             self.chat("Unbanned {}".format(unban_user))
             return unban_user
 
@@ -6,6 +6,7 @@ import janus
 from custom_stream_api.settings import DISCORD_TOKEN, DISCORD_CHANNEL
 
 from custom_stream_api.chatbot.chatbot import ChatBot
+from custom_stream_api.metrics import latency
 from custom_stream_api.shared import run_async_in_thread
 
 logger = logging.getLogger(__name__)
@@ -36,10 +37,12 @@ async def on_ready():
 
 @client.event
 async def on_message(message):
+    latency.start_trace("discord")
     # modify this to however your roles are in your discord
     badge_mapping = {"admin": "admin", "mod": "moderator", "vip": "vip"}
     user_badges = [badge_mapping.get(role.name, "chat") for role in message.author.roles]
     badges = [badge for badge in chatbot_instance.badge_levels if badge.value in user_badges]
+    latency.mark("badges")
 
     if message.author == client.user:
         return
@@ -69,3 +69,11 @@ class Timer(Base):
 
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class BannedUser(Base):
+    __tablename__ = "banned_user"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    name = Column(Text, unique=True, nullable=False)
@@ -6,7 +6,7 @@ from zoneinfo import ZoneInfo
 
 from custom_stream_api.settings import TIMER_TZ
 from custom_stream_api.chatbot.models import Timer
-from custom_stream_api.shared import run_async_in_thread, db  # db_session, set_db
+from custom_stream_api.shared import bump_version, run_async_in_thread, db  # db_session, set_db
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +36,7 @@ def calculate_next_time(cron):
 
 def check_timers(app, db, execute=True):
     now = datetime.now(TZ)
-    timers = db.session.query(Timer).filter(Timer.next_time <= now, Timer.active.is_(True))
+    timers = db.session.query(Timer).filter(Timer.next_time <= now, Timer.active.is_(True)).all()
     for timer in timers:
         if execute:
             logger.info(f"Executing timer: {timer.bot_name} {timer.command}")
@@ -50,6 +50,9 @@ def check_timers(app, db, execute=True):
         else:
             timer.next_time = cron_next_time
     db.session.commit()
+    # most ticks have nothing due, those shouldn't change the timers' ETag
+    if timers:
+        bump_version("timers")
 
 
 def add_timer(bot_name, command, cron, repeat=False, save=True):
@@ -70,6 +73,7 @@ def add_timer(bot_name, command, cron, repeat=False, save=True):
         db.session.add(new_timer)
     if save:
         db.session.commit()
+        bump_version("timers")
         ping_scheduler()
 
     return command
@@ -82,6 +86,7 @@ def remove_timer(bot_name, command):
     if found_timer.count():
         found_timer.delete()
         db.session.commit()
+        bump_version("timers")
 
         ping_scheduler()
     else:
@@ -11,6 +11,7 @@ from custom_stream_api.auth.models import RefreshToken
 from custom_stream_api.auth.twitch_auth import TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET
 
 from custom_stream_api.chatbot.chatbot import ChatBot
+from custom_stream_api.metrics import latency
 from custom_stream_api.shared import run_async_in_thread
 
 USER_SCOPE = [AuthScope.CHAT_READ, AuthScope.CHAT_EDIT]
@@ -30,7 +31,9 @@ async def on_ready(ready_event: EventData):
 
 # this will be called whenever a message in a channel was send by either the bot OR another user
 async def on_message(msg: ChatMessage):
+    latency.start_trace("twitch")
     badges = [badge for badge in chatbot_instance.badge_levels if badge.value in msg.user.badges.keys()]
+    latency.mark("badges")
 
     chatbot_instance.parse_message(msg.user.name, msg.text, badges)
 
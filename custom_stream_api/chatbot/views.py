@@ -5,8 +5,8 @@ from flask import jsonify
 from webargs import fields
 from webargs.flaskparser import use_kwargs
 
-from custom_stream_api.shared import InvalidUsage
-from custom_stream_api.chatbot import aliases, timers
+from custom_stream_api.shared import InvalidUsage, conditional_get
+from custom_stream_api.chatbot import aliases, bans, timers
 from custom_stream_api.auth import twitch_auth
 
 chatbot_endpoints = Blueprint("chatbot", __name__)
@@ -16,6 +16,7 @@ logger = logging.getLogger(__name__)
 
 @chatbot_endpoints.route("/aliases", methods=["GET"])
 @twitch_auth.twitch_login_required
+@conditional_get("aliases")
 def list_aliases_get():
     try:
         all_aliases = aliases.list_aliases()
@@ -65,6 +66,7 @@ def remove_alias_post():
 
 @chatbot_endpoints.route("/timers", methods=["GET"])
 @twitch_auth.twitch_login_required
+@conditional_get("timers")
 def list_timers_get():
     try:
         all_timers = timers.list_timers()
@@ -110,3 +112,49 @@ def remove_timer_post(**kwargs):
     except Exception as e:
         logger.exception(e)
         raise InvalidUsage(str(e))
+
+
+@chatbot_endpoints.route("/bans", methods=["GET"])
+@twitch_auth.twitch_login_required
+@conditional_get("bans")
+def list_bans_get():
+    try:
+        banned = bans.list_bans()
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    return jsonify(banned)
+
+
+@chatbot_endpoints.route("/ban", methods=["POST"])
+@twitch_auth.twitch_login_required
+@use_kwargs(
+    {
+        "names": fields.List(fields.Str(), required=True),
+    },
+    location="json",
+)
+def ban_post(**kwargs):
+    try:
+        banned = bans.ban(**kwargs)
+        return jsonify({"banned": banned})
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+
+
+@chatbot_endpoints.route("/unban", methods=["POST"])
+@twitch_auth.twitch_login_required
+@use_kwargs(
+    {
+        "names": fields.List(fields.Str(), required=True),
+    },
+    location="json",
+)
+def unban_post(**kwargs):
+    try:
+        unbanned = bans.unban(**kwargs)
+        return jsonify({"unbanned": unbanned})
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
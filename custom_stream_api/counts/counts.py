@@ -1,36 +1,230 @@
+import asyncio
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from custom_stream_api import settings
+from custom_stream_api.counts import history
 from custom_stream_api.counts.models import Count
+from custom_stream_api.alerts import cache
 from custom_stream_api.alerts.models import Tag
-from custom_stream_api.shared import db
+from custom_stream_api.shared import bump_version, db, get_app, run_async_in_thread
+
+logger = logging.getLogger(__name__)
+
+# UPDATES
+# Count widgets listen on the /counts socket.io namespace instead of polling. Changed counts are collected for
+# COUNT_PUSH_MS and then read together and sent as one {"name", "value"} update each, so a burst of !add_count is a
+# single emit with the latest value. A removed count is sent with a value of None. Widgets emit "Snapshot" when they
+# connect to get the counts they start from.
+
+NAMESPACE = "counts"
+UPDATE_EVENT = "CountUpdate"
+SNAPSHOT_EVENT = "CountSnapshot"
+
+_changed_names = set()
+_changed_lock = threading.Lock()
+
+
+def _changed(name, value, delta=0):
+    bump_version("counts")
+    history.record(name, delta, value)
+    with _changed_lock:
+        _changed_names.add(name)
+
+
+def publish_updates():
+    """Sends the current value of every count that changed since the last call, returns how many were sent"""
+    global _changed_names
+    with _changed_lock:
+        names, _changed_names = _changed_names, set()
+    socketio_queue = getattr(get_app(), "socketio_queue", None)
+    if not names or not socketio_queue:
+        return 0
+    # read when sending rather than when changed, so the last update sent is always the latest value
+    found_counts = get_counts(sorted(names))
+    for name in sorted(names):
+        data = {"name": name, "value": found_counts.get(name)}
+        socketio_queue.sync_q.put({"namespace": NAMESPACE, "event": UPDATE_EVENT, "data": data})
+    return len(names)
+
+
+def clear_updates():
+    with _changed_lock:
+        _changed_names.clear()
+
+
+def snapshot(names=None):
+    """Every count (or just the given ones) as name -> value"""
+    if names:
+        return get_counts(names)
+    return {count["name"]: count["count"] for count in list_counts()}
+
+
+async def publish_in_background(app):
+    while True:
+        await asyncio.sleep(settings.COUNT_PUSH_MS / 1000)
+        with app.flask_app.app_context():
+            try:
+                publish_updates()
+            except Exception as e:
+                logger.exception(e)
+
+
+def run_count_publisher(app):
+    run_async_in_thread(publish_in_background, app)
+
+
+# WRITE BEHIND
+# With COUNT_WRITE_BEHIND_MS set, adding to and subtracting from a count only changes its pending delta in memory. The
+# deltas are flushed in one upsert every COUNT_WRITE_BEHIND_MS, and reads add them in so counts are exact either way.
+
+_pending = defaultdict(int)
+_pending_lock = threading.Lock()
+# Held while a flush is being written so reads don't miss deltas that are on their way to the database, and setting or
+# removing a count can't be undone by deltas from before it
+_flush_lock = threading.RLock()
+
+
+def _write_behind():
+    return bool(settings.COUNT_WRITE_BEHIND_MS)
+
+
+def _buffer(name, delta):
+    with _pending_lock:
+        _pending[name] += delta
+    count = get_count(name)
+    _changed(name, count, delta)
+    return count
+
+
+def _discard_pending(name):
+    with _pending_lock:
+        _pending.pop(name, None)
+
+
+def _insert():
+    """INSERT ... ON CONFLICT for whichever database we're on, SQLite spells it the same way but needs its own insert"""
+    if db.session.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(Count)
+    return postgresql.insert(Count)
+
+
+def flush():
+    """Writes every pending delta in one upsert, returns how many counts were written"""
+    with _flush_lock:
+        with _pending_lock:
+            pending = {name: delta for name, delta in _pending.items() if delta}
+            _pending.clear()
+        if not pending:
+            return 0
+
+        statement = _insert().values([{"name": name, "count": delta} for name, delta in sorted(pending.items())])
+        statement = statement.on_conflict_do_update(
+            index_elements=["name"], set_={"count": Count.count + statement.excluded.count}
+        )
+        try:
+            db.session.execute(statement)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # keep them for the next flush
+            with _pending_lock:
+                for name, delta in pending.items():
+                    _pending[name] += delta
+            raise
+    return len(pending)
+
+
+def clear_pending():
+    with _pending_lock:
+        _pending.clear()
+
+
+async def flush_in_background(app):
+    while True:
+        await asyncio.sleep(settings.COUNT_WRITE_BEHIND_MS / 1000)
+        with app.flask_app.app_context():
+            try:
+                flush()
+            except Exception as e:
+                logger.exception(e)
+
+
+def run_count_flusher(app):
+    def flush_on_exit():
+        with app.flask_app.app_context():
+            flush()
+
+    atexit.register(flush_on_exit)
+    run_async_in_thread(flush_in_background, app)
+
+
+# COUNTS
 
 
 def list_counts():
+    if _pending:
+        flush()
     return [count.as_dict() for count in db.session.query(Count).order_by(Count.name.asc()).all()]
 
 
 def get_count(name):
-    count_obj = db.session.query(Count).filter(Count.name == name).one_or_none()
+    with _flush_lock:
+        count_obj = db.session.query(Count).filter(Count.name == name).one_or_none()
+        with _pending_lock:
+            delta = _pending.get(name)
     if count_obj:
-        return count_obj.count
+        return count_obj.count + (delta or 0)
+    return delta
 
 
-def add_to_count(name):
-    count_obj = db.session.query(Count).filter(Count.name == name).one_or_none()
-    if not count_obj:
-        count_obj = Count(name=name, count=0)
-        db.session.add(count_obj)
-    count_obj.count += 1
+def get_counts(names):
+    """Counts for many names in one query, names that don't have a count are left out"""
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    with _flush_lock:
+        stored = dict(db.session.execute(select(Count.name, Count.count).where(Count.name.in_(names))).all())
+        with _pending_lock:
+            pending = {name: _pending[name] for name in names if name in _pending}
+    found = {}
+    for name in names:
+        if name in stored:
+            found[name] = stored[name] + pending.get(name, 0)
+        elif name in pending:
+            found[name] = pending[name]
+    return found
+
+
+def _upsert(name, values, set_):
+    statement = _insert().values(name=name, **values)
+    statement = statement.on_conflict_do_update(index_elements=["name"], set_=set_(statement.excluded))
+    return db.session.execute(statement.returning(Count.count)).scalar_one()
+
+
+def _add(name, delta):
+    # one statement, so concurrent increments can't read the same value and overwrite each other
+    count = _upsert(name, {"count": delta}, lambda excluded: {"count": func.coalesce(Count.count, 0) + excluded.count})
     db.session.commit()
-    return count_obj.count
+    _changed(name, count, delta)
+    return count
+
+
+def add_to_count(name):
+    if _write_behind():
+        return _buffer(name, 1)
+    return _add(name, 1)
 
 
 def subtract_from_count(name):
-    count_obj = db.session.query(Count).filter(Count.name == name).one_or_none()
-    if not count_obj:
-        count_obj = Count(name=name, count=0)
-        db.session.add(count_obj)
-    count_obj.count -= 1
-    db.session.commit()
-    return count_obj.count
+    if _write_behind():
+        return _buffer(name, -1)
+    return _add(name, -1)
 
 
 def reset_count(name, save=True):
@@ -38,19 +232,21 @@ def reset_count(name, save=True):
 
 
 def set_count(name, count, tag_name=None, save=True):
-    count_obj = db.session.query(Count).filter(Count.name == name).one_or_none()
-    if not count_obj:
-        count_obj = Count(name=name, count=0)
-        db.session.add(count_obj)
-    count_obj.count = count
-
-    tag = db.session.query(Tag).filter_by(name=tag_name).one_or_none()
-    if tag:
-        count_obj.tag_name = tag
+    values = {"count": int(count)}
+    if tag_name:
+        tag_name = db.session.scalar(select(Tag.name).filter_by(name=tag_name))
+        if tag_name:
+            values["tag_name"] = tag_name
 
-    if save:
-        db.session.commit()
-    return count_obj.count
+    with _flush_lock:
+        _discard_pending(name)
+        count = _upsert(name, values, lambda excluded: {column: excluded[column] for column in values})
+        if save:
+            db.session.commit()
+            _changed(name, count)
+    if "tag_name" in values:
+        cache.invalidate_tags()
+    return count
 
 
 def copy_count(count1, count2):
@@ -62,8 +258,12 @@ def copy_count(count1, count2):
 
 
 def remove_count(name):
-    found_count = db.session.query(Count).filter_by(name=name)
-    if found_count.count():
-        found_count.delete()
-        db.session.commit()
-        return found_count
+    with _flush_lock:
+        _discard_pending(name)
+        found_count = db.session.query(Count).filter_by(name=name)
+        if found_count.count():
+            found_count.delete()
+            db.session.commit()
+            _changed(name, None)
+            cache.invalidate_tags()
+            return found_count
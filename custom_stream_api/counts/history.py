@@ -0,0 +1,211 @@
+"""
+What counts were over time, for charting deaths per hour or comparing one stream to the last
+
+Changes are only collected in memory as they happen; a background thread writes them every FLUSH_INTERVAL seconds,
+appending them to the count_event log and adding them into the count_rollup buckets in the same transaction. Reading
+history only touches the rollups, so it stays fast however long the log gets.
+
+A stream is a run of count changes without a gap longer than settings.COUNT_HISTORY_STREAM_GAP, its bucket starts at
+its first change. Old events and minute rollups are pruned in the background, hour and stream rollups are kept.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from custom_stream_api import settings
+from custom_stream_api.counts.models import CountEvent, CountRollup
+from custom_stream_api.shared import bump_version, db, run_async_in_thread
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 10  # seconds
+PRUNE_INTERVAL = 60 * 60  # seconds
+BUCKETS = ["minute", "hour", "stream"]
+
+# (created_at, name, delta, value) in the order they happened
+_pending = []
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+# (start, last change) of the current stream, read from the rollups on the first flush
+_stream = None
+
+
+def record(name, delta, value):
+    """Logs a change to a count, nothing is written until the next flush"""
+    with _lock:
+        _pending.append((datetime.now(timezone.utc), name, delta, value))
+
+
+def _load_stream():
+    latest_stream_query = (
+        select(CountRollup.bucket_start, func.max(CountRollup.last_event_at))
+        .where(CountRollup.bucket == "stream")
+        .group_by(CountRollup.bucket_start)
+        .order_by(CountRollup.bucket_start.desc())
+        .limit(1)
+    )
+    latest_stream = db.session.execute(latest_stream_query).first()
+    return tuple(latest_stream) if latest_stream else (None, None)
+
+
+def _bucket_starts(stream, created_at):
+    start, last_event_at = stream
+    if last_event_at is None or (created_at - last_event_at).total_seconds() > settings.COUNT_HISTORY_STREAM_GAP:
+        start = created_at
+    bucket_starts = {
+        "minute": created_at.replace(second=0, microsecond=0),
+        "hour": created_at.replace(minute=0, second=0, microsecond=0),
+        "stream": start,
+    }
+    return bucket_starts, (start, created_at)
+
+
+def _rollup(stream, pending):
+    rollups = {}
+    for created_at, name, delta, value in pending:
+        bucket_starts, stream = _bucket_starts(stream, created_at)
+        for bucket, bucket_start in bucket_starts.items():
+            rollup = rollups.get((bucket, name, bucket_start))
+            if rollup is None:
+                rollups[(bucket, name, bucket_start)] = {
+                    "bucket": bucket,
+                    "name": name,
+                    "bucket_start": bucket_start,
+                    "delta": delta,
+                    "events": 1,
+                    "value": value,
+                    "last_event_at": created_at,
+                }
+            else:
+                rollup["delta"] += delta
+                rollup["events"] += 1
+                rollup["value"] = value
+                rollup["last_event_at"] = created_at
+    return list(rollups.values()), stream
+
+
+def flush():
+    """Writes every pending change to the log and the rollups, returns how many were written"""
+    global _pending, _stream
+    with _flush_lock:
+        with _lock:
+            pending, _pending = _pending, []
+        if not pending:
+            return 0
+
+        try:
+            stream = _stream if _stream is not None else _load_stream()
+            rollups, stream = _rollup(stream, pending)
+
+            events = [
+                {"created_at": created_at, "name": name, "delta": delta, "value": value}
+                for created_at, name, delta, value in pending
+            ]
+            db.session.execute(insert(CountEvent), events)
+
+            # flushes happen in order, so whatever is being added is always the latest value
+            statement = insert(CountRollup).values(rollups)
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                constraint="_count_rollup_uc",
+                set_={
+                    "delta": CountRollup.delta + excluded.delta,
+                    "events": CountRollup.events + excluded.events,
+                    "value": excluded.value,
+                    "last_event_at": excluded.last_event_at,
+                },
+            )
+            db.session.execute(statement)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # keep them for the next flush
+            with _lock:
+                _pending[:0] = pending
+            raise
+        _stream = stream
+    return len(pending)
+
+
+def _utc(timestamp):
+    return timestamp.replace(tzinfo=timezone.utc) if timestamp.tzinfo is None else timestamp
+
+
+def history(name, from_=None, to=None, bucket="hour"):
+    """The count's buckets that started between from_ and to, oldest first"""
+    if bucket not in BUCKETS:
+        raise Exception(f"Invalid bucket: {bucket}")
+    if _pending:
+        flush()
+
+    history_query = select(CountRollup).where(CountRollup.bucket == bucket, CountRollup.name == name)
+    if from_:
+        history_query = history_query.where(CountRollup.bucket_start >= _utc(from_))
+    if to:
+        history_query = history_query.where(CountRollup.bucket_start <= _utc(to))
+    history_query = history_query.order_by(CountRollup.bucket_start.asc())
+    return [
+        {
+            "start": rollup.bucket_start.isoformat(),
+            "delta": rollup.delta,
+            "events": rollup.events,
+            "value": rollup.value,
+            "last_event_at": rollup.last_event_at.isoformat(),
+        }
+        for rollup in db.session.scalars(history_query)
+    ]
+
+
+def prune(now=None):
+    """Deletes events and minute rollups that are past their retention, returns how many rows were deleted"""
+    now = now or datetime.now(timezone.utc)
+    deleted = 0
+    if settings.COUNT_EVENT_RETENTION_DAYS:
+        cutoff = now - timedelta(days=settings.COUNT_EVENT_RETENTION_DAYS)
+        deleted += db.session.execute(delete(CountEvent).where(CountEvent.created_at < cutoff)).rowcount
+    if settings.COUNT_MINUTE_RETENTION_DAYS:
+        cutoff = now - timedelta(days=settings.COUNT_MINUTE_RETENTION_DAYS)
+        old_minutes = delete(CountRollup).where(CountRollup.bucket == "minute", CountRollup.bucket_start < cutoff)
+        deleted += db.session.execute(old_minutes).rowcount
+    db.session.commit()
+    if deleted:
+        # history responses are tagged with the counts version
+        bump_version("counts")
+    return deleted
+
+
+def clear():
+    global _stream
+    with _lock:
+        _pending.clear()
+        _stream = None
+
+
+async def write_in_background(app):
+    last_pruned = time.monotonic()
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        with app.flask_app.app_context():
+            try:
+                flush()
+                if time.monotonic() - last_pruned >= PRUNE_INTERVAL:
+                    prune()
+                    last_pruned = time.monotonic()
+            except Exception as e:
+                logger.exception(e)
+
+
+def run_history_writer(app):
+    def flush_on_exit():
+        with app.flask_app.app_context():
+            flush()
+
+    atexit.register(flush_on_exit)
+    run_async_in_thread(write_in_background, app)
@@ -1,7 +1,7 @@
 from custom_stream_api.shared import Base
 from sqlalchemy.sql import func
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Text, UniqueConstraint
 
 
 class Count(Base):
@@ -14,3 +14,32 @@ class Count(Base):
 
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class CountEvent(Base):
+    """Every change to a count, see custom_stream_api.counts.history"""
+
+    __tablename__ = "count_event"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    name = Column(Text, nullable=False)
+    delta = Column(Integer, nullable=False)  # 0 when the count was set or removed
+    value = Column(Integer)  # after the change, None when removed
+
+
+class CountRollup(Base):
+    """Count events summed into minute, hour and stream buckets"""
+
+    __tablename__ = "count_rollup"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket = Column(Text, nullable=False)  # minute, hour or stream
+    name = Column(Text, nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    delta = Column(Integer, nullable=False)
+    events = Column(Integer, nullable=False)
+    value = Column(Integer)  # at the last event in the bucket
+    last_event_at = Column(DateTime(timezone=True), nullable=False)
+    __table_args__ = (
+        UniqueConstraint("bucket", "name", "bucket_start", name="_count_rollup_uc"),
+        Index("ix_count_rollup_bucket_start", "bucket", "bucket_start"),
+    )
@@ -2,11 +2,11 @@ import logging
 
 from flask import Blueprint
 from flask import jsonify
-from webargs import fields
+from webargs import fields, validate
 from webargs.flaskparser import use_kwargs
 
-from custom_stream_api.counts import counts
-from custom_stream_api.shared import InvalidUsage
+from custom_stream_api.counts import counts, history
+from custom_stream_api.shared import InvalidUsage, conditional_get
 from custom_stream_api.auth import twitch_auth
 
 counts_endpoints = Blueprint("counts", __name__)
@@ -16,6 +16,7 @@ logger = logging.getLogger(__name__)
 
 @counts_endpoints.route("/", methods=["GET"])
 @twitch_auth.twitch_login_required
+@conditional_get("counts")
 def list_counts_get():
     try:
         all_counts = counts.list_counts()
@@ -41,6 +42,46 @@ def get_count_get(**kwargs):
     return jsonify({kwargs["name"]: count})
 
 
+@counts_endpoints.route("/batch", methods=["GET"])
+@twitch_auth.twitch_login_required
+@conditional_get("counts")
+@use_kwargs(
+    {
+        "names": fields.DelimitedList(fields.Str(), required=True),
+    },
+    location="query",
+)
+def get_counts_get(**kwargs):
+    try:
+        found_counts = counts.get_counts(**kwargs)
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    missing = [name for name in dict.fromkeys(kwargs["names"]) if name not in found_counts]
+    return jsonify({"counts": found_counts, "missing": missing})
+
+
+@counts_endpoints.route("/history", methods=["GET"])
+@twitch_auth.twitch_login_required
+@conditional_get("counts")
+@use_kwargs(
+    {
+        "name": fields.Str(required=True),
+        "from_": fields.DateTime(data_key="from"),
+        "to": fields.DateTime(),
+        "bucket": fields.Str(load_default="hour", validate=validate.OneOf(history.BUCKETS)),
+    },
+    location="query",
+)
+def count_history_get(**kwargs):
+    try:
+        count_history = history.history(**kwargs)
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    return jsonify(count_history)
+
+
 @counts_endpoints.route("/add_to_count", methods=["POST"])
 @twitch_auth.twitch_login_required
 @use_kwargs(
@@ -1,50 +1,154 @@
+import json
 import random
+import threading
+from itertools import islice
+
+from sqlalchemy import delete, func, insert, select, update
 
 from custom_stream_api.lists.models import List, ListItem
-from custom_stream_api.shared import db
+from custom_stream_api.shared import bump_version, db, decode_cursor, encode_cursor
+
+# items are inserted this many at a time, so adding a huge list never holds more than this many in memory
+CHUNK_SIZE = 1000
+MAX_LIMIT = 100
+
+# LIST NAMES
+# Chat templates check every {list_name index} against the list names, so they're kept in memory, read the first time
+# they're needed and thrown away whenever a list is created or removed.
+
+_names = None
+_names_lock = threading.Lock()
+# bumped on every invalidation, names read from before one are never kept
+_names_generation = 0
+
+
+def _list_names():
+    global _names
+    with _names_lock:
+        if _names is not None:
+            return _names
+        generation = _names_generation
+    names = frozenset(db.session.scalars(select(List.name)))
+    with _names_lock:
+        if generation == _names_generation:
+            _names = names
+    return names
+
+
+def invalidate_names():
+    global _names, _names_generation
+    with _names_lock:
+        _names = None
+        _names_generation += 1
+
+
+def list_names():
+    return sorted(_list_names())
+
+
+def list_exists(name):
+    return name in _list_names()
+
+
+# LISTS
 
 
 def import_lists(import_lists):
     for list_dict in import_lists:
         set_list(list_dict["name"], list_dict["items"], save=False)
     db.session.commit()
+    bump_version("lists")
+    invalidate_names()
+
+
+def _get_or_create_list(name):
+    """Returns whether the list had to be created"""
+    if db.session.query(List.id).filter_by(name=name).one_or_none():
+        return False
+    db.session.add(List(name=name, current_index=0, size=0))
+    return True
+
+
+def _saved(names_changed):
+    db.session.commit()
+    bump_version("lists")
+    if names_changed:
+        invalidate_names()
+
+
+def _clear_items(name):
+    db.session.execute(delete(ListItem).where(ListItem.list_name == name))
+    db.session.execute(update(List).where(List.name == name).values(size=0))
+
+
+def _reserve_positions(name, count):
+    """Grows the list by count in one UPDATE (so concurrent adds can't take the same positions), returns the first"""
+    size = db.session.execute(
+        update(List).where(List.name == name).values(size=List.size + count).returning(List.size)
+    ).scalar_one()
+    return size - count + 1
+
+
+def _insert_items(name, items):
+    """Inserts items (any iterable, e.g. lines streaming in) in chunks at the end of the list, returns how many"""
+    items = iter(items)
+    added = 0
+    while chunk := list(islice(items, CHUNK_SIZE)):
+        first_position = _reserve_positions(name, len(chunk))
+        rows = [
+            {"list_name": name, "item": item, "position": position}
+            for position, item in enumerate(chunk, first_position)
+        ]
+        db.session.execute(insert(ListItem).values(rows))
+        added += len(chunk)
+    return added
 
 
 def set_list(name, items, save=True):
-    found_list = db.session.query(List).filter_by(name=name).one_or_none()
-    if not found_list:
-        found_list = List(name=name, current_index=0)
-        db.session.add(found_list)
-    else:
-        for item in found_list.items:
-            db.session.delete(item)
+    created = _get_or_create_list(name)
+    _clear_items(name)
+    _insert_items(name, items)
     if save:
-        db.session.commit()
-    return add_to_list(name, items, save=save)
+        _saved(created)
+    return items
 
 
 def add_to_list(name, items, save=True):
-    new_items = []
-
-    found_list = db.session.query(List).filter_by(name=name).one_or_none()
-    if not found_list:
-        found_list = List(name=name)
-        db.session.add(found_list)
-
-    for item in items:
-        new_items.append(item)
-        new_item = ListItem(list_name=name, item=item)
-        db.session.add(new_item)
+    created = _get_or_create_list(name)
+    _insert_items(name, items)
     if save:
-        db.session.commit()
+        _saved(created)
     return items
 
 
+def import_items(name, lines, replace=True):
+    """
+    Fills the list with one item per line (str or bytes, e.g. a file or a request stream), replacing what was in it
+    unless replace is False. Returns how many items were added.
+    """
+    items = (line.decode() if isinstance(line, bytes) else line for line in lines)
+    items = (item.rstrip("\r\n") for item in items)
+    items = (item for item in items if item.strip())
+
+    created = _get_or_create_list(name)
+    if replace:
+        _clear_items(name)
+    added = _insert_items(name, items)
+    _saved(created)
+    return added
+
+
 def list_lists():
     list_query = db.session.query(List)
     return [list_obj.as_dict() for list_obj in list_query.order_by(List.name.asc())]
 
 
+def list_summaries():
+    """Every list's name and size, without its items"""
+    summary_query = select(List.name, List.size).order_by(List.name.asc())
+    return [{"name": name, "size": size} for name, size in db.session.execute(summary_query)]
+
+
 def get_list(name):
     list_query = db.session.query(List).filter(List.name == name).first()
     if list_query:
@@ -53,6 +157,44 @@ def get_list(name):
         return []
 
 
+def get_list_page(name, page=1, limit=MAX_LIMIT, cursor=None):
+    """
+    One page of the list's items, fetched by position. The next_cursor in the page metadata continues right after the
+    page's last item without counting pages.
+    """
+    found_list = _find_list(name)
+    after = decode_cursor(cursor, "after", list=name) if cursor else (page - 1) * limit
+    items_query = (
+        select(ListItem.position, ListItem.item)
+        .where(ListItem.list_name == name, ListItem.position > after)
+        .order_by(ListItem.position)
+        .limit(limit)
+    )
+    rows = db.session.execute(items_query).all()
+    last_position = rows[-1].position if rows else None
+    next_cursor = (
+        encode_cursor({"list": name, "after": last_position}) if rows and last_position < found_list.size else None
+    )
+    page_metadata = {"total": found_list.size, "page": page, "limit": limit, "next_cursor": next_cursor}
+    return [row.item for row in rows], page_metadata
+
+
+def stream_list(name):
+    """Yields the list's items as a JSON array, a chunk at a time, reading them through a server side cursor"""
+    items_query = (
+        select(ListItem.item)
+        .where(ListItem.list_name == name)
+        .order_by(ListItem.position)
+        .execution_options(yield_per=CHUNK_SIZE)
+    )
+    separator = ""
+    yield "["
+    for chunk in db.session.execute(items_query).partitions():
+        yield separator + ",".join(json.dumps(item) for (item,) in chunk)
+        separator = ","
+    yield "]"
+
+
 def represents_int(s):
     try:
         int(s)
@@ -62,48 +204,58 @@ def represents_int(s):
         return True
 
 
-def get_list_item(list_name, index):
-    """Index is 1-indexed, string random or next"""
+def _find_list(list_name):
     found_list = db.session.query(List).filter_by(name=list_name).one_or_none()
     if not found_list:
         raise Exception("List not found")
-    if len(found_list.items) == 0:
+    return found_list
+
+
+def _next_position(list_name):
+    # current_index is 0-indexed, advanced in one UPDATE so concurrent nexts each get their own item
+    current_index = db.session.execute(
+        update(List)
+        .where(List.name == list_name)
+        .values(current_index=(func.coalesce(List.current_index, 0) + 1) % List.size)
+        .returning(List.current_index)
+    ).scalar_one()
+    db.session.commit()
+    return current_index + 1
+
+
+def get_list_item(list_name, index):
+    """Index is 1-indexed, string random or next. Returns the item and its (1-indexed) position."""
+    found_list = _find_list(list_name)
+    size = found_list.size
+    if size == 0:
         raise Exception("Empty list")
-    items = sorted(found_list.items, key=lambda list_item: list_item.id)
 
     if index is None:
         raise Exception("index not provided")
     elif isinstance(index, int) or (isinstance(index, str) and represents_int(index)):
         index = int(index)
-        if index > len(items):
+        if index > size:
             raise Exception("Index too high")
+        elif index < -size:
+            raise Exception("Index too low")
         elif index == 0:
             raise Exception("Lists are 1-indexed.")
+        # Negative nonzero indexes count from the end
+        position = index if index > 0 else size + index + 1
     elif isinstance(index, str) and index.lower() == "random":
-        index = random.choice(range(1, len(items) + 1))
+        position = random.randint(1, size)
     elif isinstance(index, str) and index.lower() == "next":
-        # current_index is 0-indexed, adding 1 to be in sync with the rest
-        index = (found_list.current_index + 1) % len(items)
-        found_list.current_index = index
-        db.session.commit()
-        index += 1
+        position = _next_position(list_name)
     else:
         raise Exception("Invalid index. Must be a non-zero integer, 'random', or 'next'")
 
-        # Negative nonzero indexes are already 1-indexed
-        # Positive non-zero indexes need correction
-    if index > 0:
-        index = index - 1
-
-    # Need to return the index too as it could be random
-    return items[index], index + 1 if index >= 0 else len(items) + index + 1
+    # Need to return the position too as it could be random
+    found_item = db.session.query(ListItem).filter_by(list_name=list_name, position=position).one()
+    return found_item, position
 
 
 def get_list_size(list_name):
-    found_list = db.session.query(List).filter_by(name=list_name).one_or_none()
-    if not found_list:
-        raise Exception("List not found")
-    return len(found_list.items)
+    return _find_list(list_name).size
 
 
 def remove_from_list(list_name, index):
@@ -113,17 +265,22 @@ def remove_from_list(list_name, index):
             raise Exception("Invalid index")
         index = int(index)
 
-    found_list = db.session.query(List).filter_by(name=list_name).one_or_none()
-    if not found_list:
-        raise Exception("List not found")
-
+    found_list = _find_list(list_name)
     found_list_item, index = get_list_item(list_name, index)
     found_list_item_value = found_list_item.item
     db.session.delete(found_list_item)
+    # close the gap so positions stay dense
+    db.session.execute(
+        update(ListItem)
+        .where(ListItem.list_name == list_name, ListItem.position > index)
+        .values(position=ListItem.position - 1)
+    )
+    db.session.execute(update(List).where(List.name == list_name).values(size=List.size - 1))
     # current_index is 0-indexed
     if index - 1 <= found_list.current_index:
         found_list.current_index -= 1
     db.session.commit()
+    bump_version("lists")
 
     return found_list_item_value, index
 
@@ -132,6 +289,7 @@ def remove_list(name):
     found_list = db.session.query(List).filter_by(name=name)
     if not found_list.count():
         raise Exception("List not found")
+    db.session.execute(delete(ListItem).where(ListItem.list_name == name))
     found_list.delete()
-    db.session.commit()
+    _saved(names_changed=True)
     return name
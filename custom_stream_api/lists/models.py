@@ -3,7 +3,7 @@ from sqlalchemy.sql import func
 
 from custom_stream_api.shared import Base
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, Text
 from sqlalchemy.orm import relationship
 
 
@@ -15,10 +15,11 @@ class List(Base):
     name = Column(Text, unique=True, nullable=False)
     items = relationship("ListItem", cascade="all,delete", backref="tag_alert")
     current_index = Column(Integer, default=0)
+    size = Column(Integer, default=0, nullable=False)
 
     def as_dict(self):
         name = getattr(self, "name")
-        items_query = db.session.query(ListItem.item).filter_by(list_name=name).order_by(ListItem.id)
+        items_query = db.session.query(ListItem.item).filter_by(list_name=name).order_by(ListItem.position)
         items = [result[0] for result in items_query]
         return {"name": name, "items": items}
 
@@ -29,3 +30,6 @@ class ListItem(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     list_name = Column(Text, ForeignKey("list.name"), nullable=False)
     item = Column(Text, nullable=False)
+    # 1-indexed, kept without gaps so an item can be looked up by where it is in the list
+    position = Column(Integer, nullable=False)
+    __table_args__ = (Index("ix_list_item_list_name_position", "list_name", "position"),)
@@ -1,12 +1,12 @@
 import logging
 
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, stream_with_context
 from flask import jsonify
 
 from webargs import fields
 from webargs.flaskparser import use_kwargs
 
-from custom_stream_api.shared import InvalidUsage
+from custom_stream_api.shared import InvalidUsage, conditional_get
 from custom_stream_api.lists import lists
 from custom_stream_api.auth import twitch_auth
 
@@ -17,9 +17,16 @@ logger = logging.getLogger(__name__)
 
 @lists_endpoints.route("/", methods=["GET", "POST"])
 @twitch_auth.twitch_login_required
-def list_lists_get():
+@conditional_get("lists")
+@use_kwargs(
+    {
+        "summary": fields.Bool(load_default=False),
+    },
+    location="query",
+)
+def list_lists_get(**kwargs):
     try:
-        all_lists = lists.list_lists()
+        all_lists = lists.list_summaries() if kwargs["summary"] else lists.list_lists()
     except Exception as e:
         raise InvalidUsage(str(e))
     return jsonify(all_lists)
@@ -61,17 +68,49 @@ def add_to_list_post(**kwargs):
     return jsonify({"message": "Added to list: {}".format(kwargs["items"])})
 
 
+@lists_endpoints.route("/import", methods=["POST"])
+@twitch_auth.twitch_login_required
+@use_kwargs(
+    {
+        "name": fields.Str(required=True),
+        "replace": fields.Bool(load_default=True),
+    },
+    location="query",
+)
+def import_items_post(**kwargs):
+    """The body is the items, one per line, read as it streams in"""
+    try:
+        added = lists.import_items(lines=request.stream, **kwargs)
+    except Exception as e:
+        logger.exception(e)
+        raise InvalidUsage(str(e))
+    return jsonify({"message": "Imported to list: {}".format(kwargs["name"]), "added": added})
+
+
 @lists_endpoints.route("/get_list", methods=["GET"])
 @twitch_auth.twitch_login_required
 @use_kwargs(
     {
         "name": fields.Str(required=True),
+        "page": fields.Int(validate=lambda val: val > 0, load_default=None),
+        "limit": fields.Int(validate=lambda val: val > 0, load_default=None),
+        "cursor": fields.Str(load_default=None),
+        "stream": fields.Bool(load_default=False),
     },
     location="query",
 )
 def get_list(**kwargs):
+    """The whole list by default, a page of it with page/limit/cursor, or streamed as it's read with stream=true"""
+    name = kwargs["name"]
+    if kwargs["stream"]:
+        return Response(stream_with_context(lists.stream_list(name)), mimetype="application/json")
     try:
-        list_dict = lists.get_list(**kwargs)
+        if kwargs["page"] or kwargs["limit"] or kwargs["cursor"]:
+            items, page_metadata = lists.get_list_page(
+                name, page=kwargs["page"] or 1, limit=kwargs["limit"] or lists.MAX_LIMIT, cursor=kwargs["cursor"]
+            )
+            return jsonify({"items": items, "page_metadata": page_metadata})
+        list_dict = lists.get_list(name)
     except Exception as e:
         logger.exception(e)
         raise InvalidUsage(str(e))
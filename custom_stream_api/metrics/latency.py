@@ -0,0 +1,117 @@
+"""
+Where the time goes between a chat line arriving and its alert leaving for the overlay
+
+A trace is started when a chat message comes in and stamped as it moves along: badge mapping, alias refresh, command
+dispatch, the alert/tag lookup, the socket.io queue hop and the emit itself. The time between stamps is recorded per
+stage and kept in a rolling window to report percentiles from. Only chat lines that got as far as looking up an alert
+are recorded, plain chat and other commands would drown them out.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from custom_stream_api import settings
+
+logger = logging.getLogger(__name__)
+
+# how many of the latest samples per stage the percentiles are computed from
+WINDOW_SIZE = 1024
+PERCENTILES = [50, 95, 99]
+
+_current_trace = ContextVar("latency_trace", default=None)
+_samples = defaultdict(lambda: deque(maxlen=WINDOW_SIZE))
+_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, source):
+        self.source = source
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.stages = []
+        # set once the trace is riding along with a queued message, the emitter finishes it
+        self.handed_off = False
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self.last_mark) * 1000))
+        self.last_mark = now
+
+    def reached(self, stage):
+        return any(marked_stage == stage for marked_stage, _ in self.stages)
+
+    def finish(self):
+        total = (self.last_mark - self.started) * 1000
+        # a stage can be hit more than once (aliases redirect to other commands), count it as one
+        stage_durations = defaultdict(float)
+        for stage, duration in self.stages:
+            stage_durations[stage] += duration
+        with _lock:
+            for stage, duration in stage_durations.items():
+                _samples[stage].append(duration)
+            _samples["total"].append(total)
+
+        if settings.SLOW_TRIGGER_MS is not None and total >= settings.SLOW_TRIGGER_MS:
+            breakdown = ", ".join(f"{stage}: {duration:.1f}ms" for stage, duration in stage_durations.items())
+            logger.warning(f"Slow {self.source} trigger took {total:.1f}ms ({breakdown})")
+
+
+def start_trace(source):
+    trace = Trace(source)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def mark(stage):
+    """Stamps the current trace, if there is one"""
+    trace = _current_trace.get()
+    if trace:
+        trace.mark(stage)
+
+
+def hand_off():
+    """Detaches the current trace so it can travel with a queued message"""
+    trace = _current_trace.get()
+    if trace:
+        trace.handed_off = True
+        _current_trace.set(None)
+    return trace
+
+
+def end_trace():
+    """Finishes the current trace unless it was handed off, or drops it if it never got to an alert lookup"""
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    if trace and not trace.handed_off and trace.reached("lookup"):
+        trace.finish()
+
+
+def _percentile(sorted_samples, percentile):
+    index = min(len(sorted_samples) - 1, int(round(percentile / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summary():
+    """Per stage sample count and percentiles in milliseconds"""
+    with _lock:
+        samples = {stage: sorted(stage_samples) for stage, stage_samples in _samples.items()}
+    return {
+        stage: {
+            "count": len(stage_samples),
+            **{f"p{percentile}": round(_percentile(stage_samples, percentile), 3) for percentile in PERCENTILES},
+        }
+        for stage, stage_samples in samples.items()
+        if stage_samples
+    }
+
+
+def reset():
+    with _lock:
+        _samples.clear()
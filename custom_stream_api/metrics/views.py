@@ -0,0 +1,25 @@
+import logging
+
+from flask import Blueprint
+from flask import jsonify
+
+from custom_stream_api.metrics import latency
+from custom_stream_api.shared import get_app
+from custom_stream_api.auth import twitch_auth
+
+metrics_endpoints = Blueprint("metrics", __name__)
+
+logger = logging.getLogger(__name__)
+
+
+@metrics_endpoints.route("/latency", methods=["GET"])
+@twitch_auth.twitch_login_required
+def latency_get():
+    return jsonify(latency.summary())
+
+
+@metrics_endpoints.route("/overlay_queue", methods=["GET"])
+@twitch_auth.twitch_login_required
+def overlay_queue_get():
+    overlay_dispatcher = getattr(get_app(), "overlay_dispatcher", None)
+    return jsonify(overlay_dispatcher.stats() if overlay_dispatcher else {})
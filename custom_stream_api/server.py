@@ -3,6 +3,10 @@ import uvicorn
 
 from custom_stream_api import settings
 from custom_stream_api.shared import create_app, run_socket_io_thread
+from custom_stream_api.alerts.search import run_index_builder
+from custom_stream_api.alerts.usage import run_usage_flusher
+from custom_stream_api.counts.counts import run_count_flusher, run_count_publisher
+from custom_stream_api.counts.history import run_history_writer
 
 from custom_stream_api.chatbot.twitchbot import run_twitchbot_thread
 from custom_stream_api.chatbot.discordbot import run_discordbot_thread
@@ -14,6 +18,7 @@ logger = logging.getLogger(__name__)
 
 if sio:
     run_socket_io_thread(app, sio)
+    run_count_publisher(app)
 
 if settings.TWITCH_CLIENT_SECRET:
     app.twitch_chatbot = run_twitchbot_thread(app, db)
@@ -22,6 +27,11 @@ if settings.DISCORD_TOKEN:
     app.discord_chatbot = run_discordbot_thread()
 
 run_scheduler(app, db)
+run_usage_flusher(app)
+run_history_writer(app)
+if settings.COUNT_WRITE_BEHIND_MS:
+    run_count_flusher(app)
+run_index_builder(app)
 
 if __name__ == "__main__":
     if not settings.SECRET:
@@ -31,6 +31,23 @@ BOT_NAME = ""
 TWITCH_CHANNEL = ""
 # Set to a supported string of IANA tz
 TIMER_TZ = None
+# Log how long each stage took for chat triggered alerts slower than this many milliseconds, None to turn it off
+SLOW_TRIGGER_MS = None
+# Keep count increments in memory and write them every this many milliseconds, None writes every change right away
+COUNT_WRITE_BEHIND_MS = None
+# Count changes pushed to the /counts socket.io namespace are collected for this many milliseconds, one update per count
+COUNT_PUSH_MS = 250
+# Count history: a gap this long (in seconds) without any count changing starts a new stream
+COUNT_HISTORY_STREAM_GAP = 4 * 60 * 60
+COUNT_EVENT_RETENTION_DAYS = 30  # every single change, None keeps them forever
+COUNT_MINUTE_RETENTION_DAYS = 7  # per minute totals, None keeps them forever. Hourly and per stream are always kept
+
+# Overlay Queue Settings
+OVERLAY_QUEUE_SIZE = 50  # alerts waiting to play, past this they get dropped
+OVERLAY_DROP_POLICY = "lowest_priority"  # when full: "newest" drops the incoming alert, "lowest_priority" makes room
+OVERLAY_COALESCE_SECONDS = 2  # identical alerts this close together play once with a multiplier
+OVERLAY_MAX_PER_SECOND = 5  # alerts sent to the overlay per second, 0 for no limit
+OVERLAY_TAG_COOLDOWN = 0  # seconds before the same tag can queue another alert, 0 for no cooldown
 
 # Hue Lights Settings
 LIGHTS_LOCAL = True
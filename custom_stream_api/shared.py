@@ -1,15 +1,21 @@
 import asyncio
+import base64
+import hashlib
 import janus
+import json
 import logging
 import logging.config
 import os
 import socketio
 import threading
+import uuid
+from collections import defaultdict
+from functools import wraps
 
 from alembic.config import Config
 from alembic import command
 from flask import Flask
-from flask import jsonify
+from flask import jsonify, make_response, request
 from flask_cors import CORS
 from asgiref.wsgi import WsgiToAsgi
 
@@ -86,16 +92,45 @@ def run_async_in_thread(task, *args, **kwargs):
 # MAGICAL SYNC -> SYNC
 
 
+async def emit_queue_message(sio, queue_message):
+    trace = queue_message.get("trace")
+    if trace:
+        trace.mark("queue")
+    event = queue_message.get("event", "FromAPI")
+    await sio.emit(event, queue_message["data"], namespace=f"/{queue_message['namespace']}")
+    if trace:
+        trace.mark("emit")
+        trace.finish()
+
+
 async def socket_io_emitter(sio, socketio_queue):
     while True:
         queue_message = await socketio_queue.get()
-        await sio.emit("FromAPI", queue_message["data"], namespace=f"/{queue_message['namespace']}")
+        await emit_queue_message(sio, queue_message)
         socketio_queue.task_done()
 
 
+async def overlay_emitter(sio, overlay_dispatcher):
+    while True:
+        # waiting in a worker thread with a timeout so it never holds up shutting down
+        queue_message = await asyncio.to_thread(overlay_dispatcher.get, 1)
+        if queue_message:
+            await emit_queue_message(sio, queue_message)
+
+
 def run_socket_io_thread(app, sio):
+    from custom_stream_api.alerts.dispatcher import OverlayDispatcher
+
     app.socketio_queue = janus.Queue()
+    app.overlay_dispatcher = OverlayDispatcher(
+        max_size=settings.OVERLAY_QUEUE_SIZE,
+        drop_policy=settings.OVERLAY_DROP_POLICY,
+        coalesce_seconds=settings.OVERLAY_COALESCE_SECONDS,
+        max_per_second=settings.OVERLAY_MAX_PER_SECOND,
+        tag_cooldown=settings.OVERLAY_TAG_COOLDOWN,
+    )
     run_async_in_thread(socket_io_emitter, sio, app.socketio_queue.async_q)
+    run_async_in_thread(overlay_emitter, sio, app.overlay_dispatcher)
 
 
 # In async land, it seems like accessing the global constants among modules isn't available
@@ -113,6 +148,80 @@ def get_db():
     return db
 
 
+# CONDITIONAL GETS
+# Every resource has a version that its module bumps after each write. Read endpoints tag their responses with the
+# versions they depend on, so a client that already has the latest gets a 304 without the database being touched.
+
+# Different per process so a restart (versions back at 0) can't match an ETag from before it
+_instance_id = uuid.uuid4().hex[:8]
+_versions = defaultdict(int)
+_versions_lock = threading.Lock()
+
+
+def bump_version(resource):
+    with _versions_lock:
+        _versions[resource] += 1
+
+
+def reset_versions():
+    with _versions_lock:
+        _versions.clear()
+
+
+def conditional_get(*resources):
+    """Adds a strong ETag to the response, answering a matching If-None-Match with a 304"""
+
+    def decorator(func):
+        @wraps(func)
+        def check_etag(*args, **kwargs):
+            if request.method != "GET":
+                return func(*args, **kwargs)
+            # read before the view runs, a write while it's running makes the next request fetch again
+            with _versions_lock:
+                versions = ".".join(str(_versions[resource]) for resource in resources)
+            query_hash = hashlib.sha1(request.query_string).hexdigest()[:8]
+            etag = f"{_instance_id}-{versions}-{query_hash}"
+
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            return response
+
+        return check_etag
+
+    return decorator
+
+
+# CURSORS
+# Opaque continuation tokens for paged endpoints: the position to continue from, plus whatever it was made for
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor, key, **expected):
+    """
+    Decodes a cursor and returns its position under key, making sure it was made for the same sort/search/list it's
+    being used with
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise Exception(f"Invalid cursor: {cursor}")
+    if (
+        not isinstance(position, dict)
+        or key not in position
+        or any(position.get(name) != value for name, value in expected.items())
+    ):
+        raise Exception(f"Invalid cursor: {cursor}")
+    return position[key]
+
+
 # @contextmanager
 # def db_session(engine, commit=True):
 #     """Provides a transactional scope around a series of operations."""
@@ -172,6 +281,19 @@ def create_app(**settings_override):
     def preview():
         pass
 
+    @sio.on("Snapshot", namespace="/counts")
+    async def counts_snapshot(sid, data=None):
+        from custom_stream_api.counts import counts
+
+        names = (data or {}).get("names")
+
+        def read_snapshot():
+            with flask_app.app_context():
+                return counts.snapshot(names)
+
+        found_counts = await asyncio.to_thread(read_snapshot)
+        await sio.emit(counts.SNAPSHOT_EVENT, found_counts, to=sid, namespace="/counts")
+
     DEFAULT_CONFIG["handlers"]["file"] = {
         "formatter": "default",
         "class": "logging.FileHandler",
@@ -185,6 +307,8 @@ def create_app(**settings_override):
     from custom_stream_api.counts.views import counts_endpoints
     from custom_stream_api.chatbot.views import chatbot_endpoints
     from custom_stream_api.auth.views import auth_endpoints
+    from custom_stream_api.metrics.views import metrics_endpoints
+    from custom_stream_api.backup.views import backup_endpoints
 
     # from custom_stream_api.lights.views import lights_endpoints
     flask_app.register_blueprint(alert_endpoints, url_prefix="/alerts")
@@ -192,6 +316,8 @@ def create_app(**settings_override):
     flask_app.register_blueprint(counts_endpoints, url_prefix="/counts")
     flask_app.register_blueprint(chatbot_endpoints, url_prefix="/chatbot")
     flask_app.register_blueprint(auth_endpoints, url_prefix="/auth")
+    flask_app.register_blueprint(metrics_endpoints, url_prefix="/metrics")
+    flask_app.register_blueprint(backup_endpoints)
     # app.register_blueprint(lights_endpoints, url_prefix='/lights')
 
     @flask_app.errorhandler(InvalidUsage)
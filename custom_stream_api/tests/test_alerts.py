@@ -1,125 +1,12 @@
+import mock
 import pytest
+import re
 
-from custom_stream_api.alerts import alerts
-from custom_stream_api.alerts.models import Alert, Tag
+from custom_stream_api.alerts import alerts, dispatcher, media, usage
+from custom_stream_api.alerts.models import Alert, Tag, Usage, serialize_alerts, serialize_tags
 from custom_stream_api.counts import counts
-from custom_stream_api.shared import db
-
-from custom_stream_api.tests.factories.alert_factories import (
-    AlertFactory,
-    TagFactory,
-    TagAssociationFactory,
-)
-from custom_stream_api.tests.factories.counts_factories import CountFactory
-
-TEST_ALERTS = []
-TEST_TAGS = []
-
-
-@pytest.fixture(scope="function")
-def import_alerts(session):
-    global TEST_ALERTS
-
-    session.query(AlertFactory._meta.model).delete()
-    session.commit()
-
-    TEST_ALERTS = [
-        AlertFactory(
-            name="test_text_1",
-            text="Test Text 1",
-            sound="http://www.test.com/test_sound_1.mp3",
-            image="",
-            thumbnail="",
-            effect="",
-        ),
-        AlertFactory(
-            name="test_text_2",
-            text="Test Text 2",
-            sound="http://www.test.com/test_sound_2.mp3",
-            image="",
-            thumbnail="",
-            effect="",
-        ),
-        AlertFactory(
-            name="test_text_3",
-            text="Test Text 3",
-            sound="http://www.test.com/test_sound_3.mp3",
-            image="",
-            thumbnail="",
-            effect="",
-        ),
-    ]
-    TEST_ALERTS = [test_alert for test_alert in TEST_ALERTS]
-
-    session.add_all(TEST_ALERTS)
-    session.commit()
-
-    yield session
-
-    session.query(AlertFactory._meta.model).delete()
-    session.commit()
-
-
-@pytest.fixture(scope="function")
-def import_tags(import_alerts, session):
-    global TEST_TAGS, TEST_ALERTS  # noqa
-
-    session.query(TagAssociationFactory._meta.model).delete()
-    session.query(TagFactory._meta.model).delete()
-    session.commit()
-
-    TEST_TAGS = [
-        TagFactory(name="first_two", display_name="first two", thumbnail=None, chat_message=None, always_chat=False),
-        TagFactory(
-            name="last_two", display_name="last two", thumbnail=None, chat_message="last two!", always_chat=True
-        ),
-        TagFactory(name="random", display_name="random", thumbnail=None, chat_message=None, always_chat=False),
-    ]
-
-    TEST_TAG_ASSOCIATIONS = [
-        TagAssociationFactory(tag_name=TEST_TAGS[0].name, alert_name=TEST_ALERTS[0].name),
-        TagAssociationFactory(tag_name=TEST_TAGS[0].name, alert_name=TEST_ALERTS[1].name),
-        TagAssociationFactory(tag_name=TEST_TAGS[1].name, alert_name=TEST_ALERTS[1].name),
-        TagAssociationFactory(tag_name=TEST_TAGS[1].name, alert_name=TEST_ALERTS[2].name),
-    ]
-
-    session.add_all(TEST_TAG_ASSOCIATIONS)
-    session.add_all(TEST_TAGS)
-    session.commit()
-
-    TEST_TAGS = [test_tag for test_tag in TEST_TAGS]
-
-    yield session
-
-    session.query(TagAssociationFactory._meta.model).delete()
-    session.query(TagFactory._meta.model).delete()
-    session.commit()
-
-
-@pytest.fixture(scope="function")
-def import_counts(import_tags, session):
-    session.query(CountFactory._meta.model).delete()
-    session.commit()
-
-    TEST_COUNTS = [
-        CountFactory(
-            name="count1",
-            count=37,
-            tag_name=TEST_TAGS[0].name,
-        ),
-        CountFactory(
-            name="count2",
-            count=2,
-            tag_name=TEST_TAGS[0].name,
-        ),
-    ]
-    session.add_all(TEST_COUNTS)
-    session.commit()
-
-    yield session
-
-    session.query(CountFactory._meta.model).delete()
-    session.commit()
+from custom_stream_api.metrics import latency
+from custom_stream_api.shared import db, encode_cursor, get_app
 
 
 def test_validate_sound():
@@ -259,31 +146,35 @@ def test_save_alert(import_alerts):
     assert expected == test_text_4_dict
 
 
-def test_set_tags(import_tags):
-    alerts.set_tags(TEST_ALERTS[2].name, ["first_two"])
+def test_set_tags(import_alerts, import_tags, count_statements):
+    assert alerts.set_tags(import_alerts[2].name, ["first_two"]) == {"added": ["first_two"], "removed": ["last_two"]}
     first_two_tags = db.session.query(Tag).filter_by(name="first_two").one()
     last_two_tags = db.session.query(Tag).filter_by(name="last_two").one()
-    assert TEST_ALERTS[2].name in first_two_tags.as_dict()["alerts"]
-    assert TEST_ALERTS[2].name not in last_two_tags.as_dict()["alerts"]
+    assert import_alerts[2].name in first_two_tags.as_dict()["alerts"]
+    assert import_alerts[2].name not in last_two_tags.as_dict()["alerts"]
 
-    alerts.set_tags(TEST_ALERTS[2].name, ["last_two"])
+    alerts.set_tags(import_alerts[2].name, ["last_two"])
     first_two_tags = db.session.query(Tag).filter_by(name="first_two").one()
     last_two_tags = db.session.query(Tag).filter_by(name="last_two").one()
-    assert TEST_ALERTS[2].name not in first_two_tags.as_dict()["alerts"]
-    assert TEST_ALERTS[2].name in last_two_tags.as_dict()["alerts"]
+    assert import_alerts[2].name not in first_two_tags.as_dict()["alerts"]
+    assert import_alerts[2].name in last_two_tags.as_dict()["alerts"]
 
     # Ignore tags that don't exist
-    alerts.set_tags(TEST_ALERTS[2].name, ["last_two", "ignore this tag"])
+    alerts.set_tags(import_alerts[2].name, ["last_two", "ignore this tag"])
     ignore_tag = db.session.query(Tag).filter_by(name="ignore this tag").one_or_none()
     assert ignore_tag is None
 
     # Test removing empty tags
-    alerts.set_tags(TEST_ALERTS[2].name, [])
-    alerts.set_tags(TEST_ALERTS[1].name, ["first_two"])
+    alerts.set_tags(import_alerts[2].name, [])
+    alert_name = import_alerts[1].name
+    with count_statements() as statements:
+        alerts.set_tags(alert_name, ["first_two"])
+    # alert lookup, delete links, insert links, delete empty tags
+    assert len(statements) == 4
 
     first_two_tags = db.session.query(Tag).filter_by(name="first_two").one()
-    assert TEST_ALERTS[1].name in first_two_tags.as_dict()["alerts"]
-    assert TEST_ALERTS[2].name not in first_two_tags.as_dict()["alerts"]
+    assert import_alerts[1].name in first_two_tags.as_dict()["alerts"]
+    assert import_alerts[2].name not in first_two_tags.as_dict()["alerts"]
 
     last_two_tags = db.session.query(Tag).filter_by(name="last_two").one_or_none()
     assert last_two_tags is None
@@ -291,20 +182,43 @@ def test_set_tags(import_tags):
 
 def test_alert(import_alerts):
     expected = "Test Text 1"
-    assert alerts.alert(TEST_ALERTS[0].name, hit_socket=False)["text"] == expected
+    assert alerts.alert(import_alerts[0].name, hit_socket=False)["text"] == expected
+
+
+def test_alert_cache(import_alerts, import_tags, count_statements):
+    for test_alert in import_alerts:
+        alerts.alert(test_alert.name, hit_socket=False)
+    alerts.tag_alert(import_tags[0].name, hit_socket=False)
+
+    # cached triggers don't hit the database
+    with count_statements() as statements:
+        alerts.alert(import_alerts[0].name, hit_socket=False)
+        alerts.tag_alert(import_tags[0].name, hit_socket=False)
+    assert statements == []
+
+    # writes invalidate the cache
+    alerts.save_alert(name=import_alerts[0].name, text="New Text 1", sound=import_alerts[0].sound)
+    assert alerts.alert(import_alerts[0].name, hit_socket=False)["text"] == "New Text 1"
+
+    alerts.set_alerts(import_tags[0].name, [import_alerts[2].name])
+    assert alerts.tag_alert(import_tags[0].name, hit_socket=False)["text"] == "Test Text 3"
+
+    alerts.remove_alert(import_alerts[0].name)
+    with pytest.raises(Exception, match="Alert not found"):
+        alerts.alert(import_alerts[0].name, hit_socket=False)
 
 
 def test_alert_details(import_alerts):
-    assert alerts.alert_details(TEST_ALERTS[0].name) == TEST_ALERTS[0].as_dict()
+    assert alerts.alert_details(import_alerts[0].name) == import_alerts[0].as_dict()
 
 
-def test_remove_alert(import_tags):
-    alerts.remove_alert(TEST_ALERTS[1].name)
+def test_remove_alert(import_alerts, import_tags):
+    alerts.remove_alert(import_alerts[1].name)
     all_alerts = [alert["name"] for alert in alerts.browse(include_tags=False)[0]]
     assert "test_text_2" not in all_alerts
 
     first_two_tags = db.session.query(Tag).filter_by(name="first_two").one()
-    assert TEST_ALERTS[1].name not in first_two_tags.alerts
+    assert import_alerts[1].name not in first_two_tags.alerts
 
 
 # TAGS
@@ -347,26 +261,29 @@ def test_save_tag(import_tags):
 
 
 def test_set_alerts(import_tags):
-    alerts.set_alerts(TEST_TAGS[0].name, ["test_text_3"])
+    assert alerts.set_alerts(import_tags[0].name, ["test_text_3"]) == {
+        "added": ["test_text_3"],
+        "removed": ["test_text_1", "test_text_2"],
+    }
     text_text_3_alert = db.session.query(Alert).filter_by(name="test_text_3").one()
-    assert TEST_TAGS[0].name in text_text_3_alert.as_dict()["tags"]
-    assert TEST_TAGS[0].as_dict()["alerts"] == ["test_text_3"]
+    assert import_tags[0].name in text_text_3_alert.as_dict()["tags"]
+    assert import_tags[0].as_dict()["alerts"] == ["test_text_3"]
 
     # Ignore tags that don't exist
-    alerts.set_alerts(TEST_TAGS[0].name, ["test_text_3", "ignore this alert"])
+    alerts.set_alerts(import_tags[0].name, ["test_text_3", "ignore this alert"])
     ignore_alert = db.session.query(Alert).filter_by(name="ignore this alert").one_or_none()
     assert ignore_alert is None
 
 
-def test_tag_alert(import_counts):
+def test_tag_alert(import_tags, import_tag_counts):
     expected = ["Test Text 2", "Test Text 3"]
-    assert alerts.tag_alert(TEST_TAGS[1].name, hit_socket=False)["text"] in expected
+    assert alerts.tag_alert(import_tags[1].name, hit_socket=False)["text"] in expected
 
     expected = ["Test Text 1", "Test Text 2"]
-    assert alerts.tag_alert(TEST_TAGS[0].name, hit_socket=False)["text"] in expected
+    assert alerts.tag_alert(import_tags[0].name, hit_socket=False)["text"] in expected
 
     expected = ["Test Text 1", "Test Text 2"]
-    assert alerts.tag_alert(TEST_TAGS[0].name, hit_socket=False)["text"] in expected
+    assert alerts.tag_alert(import_tags[0].name, hit_socket=False)["text"] in expected
 
     expected = ["Test Text 1", "Test Text 2", "Test Text 3"]
     assert alerts.tag_alert("random", hit_socket=False)["text"] in expected
@@ -378,21 +295,269 @@ def test_tag_alert(import_counts):
     assert count == 4
 
 
+def test_tag_alert_round_robin(import_tags):
+    texts = [alerts.tag_alert(import_tags[1].name, random_choice=False, hit_socket=False)["text"] for _ in range(5)]
+    assert texts == ["Test Text 2", "Test Text 3", "Test Text 2", "Test Text 3", "Test Text 2"]
+    assert db.session.query(Tag.current_index).filter_by(name=import_tags[1].name).scalar() == 1
+
+    # a cursor left past the end by removed alerts wraps around instead of failing
+    db.session.query(Tag).filter_by(name=import_tags[1].name).update({"current_index": 7})
+    assert alerts.tag_alert(import_tags[1].name, random_choice=False, hit_socket=False)["text"] == "Test Text 3"
+
+
+def test_random_tag(import_alerts, import_tags, count_statements):
+    alerts.tag_alert("random", hit_socket=False)
+
+    # draws come from memory, kept up to date as alerts come and go
+    alert_names = [test_alert.name for test_alert in import_alerts]
+    with count_statements() as statements:
+        chosen = {alerts.cache.random_alert_name() for _ in range(50)}
+    assert statements == []
+    assert chosen == set(alert_names)
+
+    alerts.save_alert(name="test_text_4", text="Test Text 4")
+    alerts.remove_alert("test_text_1")
+    chosen = {alerts.cache.random_alert_name() for _ in range(100)}
+    assert chosen == {"test_text_2", "test_text_3", "test_text_4"}
+
+    for alert_name in ["test_text_2", "test_text_3", "test_text_4"]:
+        alerts.remove_alert(alert_name)
+    with pytest.raises(Exception, match="No alerts to choose from"):
+        alerts.tag_alert("random", hit_socket=False)
+
+
+def test_overlay_dispatcher(import_tags):
+    def alert_data(text):
+        return {"text": text, "sound": "", "effect": "", "image": ""}
+
+    # identical alerts waiting to be sent are merged into one with a multiplier
+    overlay = dispatcher.OverlayDispatcher(max_size=2, coalesce_seconds=10, max_per_second=0)
+    for _ in range(3):
+        assert overlay.put("live", alert_data("a"))
+    assert overlay.stats()["depth"] == 1
+    assert overlay.get(0)["data"] == {**alert_data("a"), "multiplier": 3}
+    assert overlay.get(0) is None
+
+    # when full, the least important newest alert makes room for a more important one
+    assert overlay.put("live", alert_data("chat 1"), priority=dispatcher.PRIORITY_CHAT)
+    assert overlay.put("live", alert_data("chat 2"), priority=dispatcher.PRIORITY_CHAT)
+    assert not overlay.put("live", alert_data("chat 3"), priority=dispatcher.PRIORITY_CHAT)
+    assert overlay.put("live", alert_data("dashboard"), priority=dispatcher.PRIORITY_DASHBOARD)
+    assert [overlay.get(0)["data"]["text"] for _ in range(2)] == ["dashboard", "chat 1"]
+    assert overlay.stats() == {"depth": 0, "max_size": 2, "sent": 3, "merged": 2, "dropped": {"full": 1, "evicted": 1}}
+
+    overlay = dispatcher.OverlayDispatcher(max_size=1, drop_policy="newest", max_per_second=1, tag_cooldown=10)
+    assert overlay.put("live", alert_data("a"), tag="first_two")
+    assert not overlay.put("live", alert_data("b"), tag="first_two")
+    assert not overlay.put("live", alert_data("c"), priority=dispatcher.PRIORITY_DASHBOARD)
+    assert overlay.stats()["dropped"] == {"tag_cooldown": 1, "full": 1}
+
+    # sending is capped at max_per_second
+    assert overlay.get(0)["data"]["text"] == "a"
+    assert overlay.put("live", alert_data("c"))
+    assert overlay.get(0.05) is None
+    assert overlay.get(1)["data"]["text"] == "c"
+
+    # the traces of merged and dropped alerts are finished, the emitter never sees them
+    latency.reset()
+    overlay = dispatcher.OverlayDispatcher(max_size=1, coalesce_seconds=10, max_per_second=0)
+    for text in ["a", "a"]:
+        assert overlay.put("live", alert_data(text), priority=dispatcher.PRIORITY_CHAT, trace=latency.Trace("test"))
+    sent_trace = latency.Trace("test")
+    assert overlay.put("live", alert_data("b"), trace=sent_trace)
+    assert not overlay.put("live", alert_data("c"), priority=dispatcher.PRIORITY_CHAT, trace=latency.Trace("test"))
+    summary = latency.summary()
+    assert {stage: summary[stage]["count"] for stage in summary} == {"merged": 1, "dropped": 2, "total": 3}
+    assert overlay.get(0)["trace"] is sent_trace
+
+    # chat triggered tags queue with their tag and a lower priority
+    overlay_dispatcher = mock.Mock()
+    with mock.patch.object(get_app(), "overlay_dispatcher", new=overlay_dispatcher, create=True):
+        alert_data = alerts.tag_alert(import_tags[0].name, priority=dispatcher.PRIORITY_CHAT)
+    overlay_dispatcher.put.assert_called_once_with(
+        "live", alert_data, priority=dispatcher.PRIORITY_CHAT, tag=import_tags[0].name, trace=None
+    )
+
+
 def test_tag_details(import_tags):
-    assert alerts.tag_details(TEST_TAGS[0].name) == TEST_TAGS[0].as_dict()
+    assert alerts.tag_details(import_tags[0].name) == import_tags[0].as_dict()
 
 
 def test_remove_tag(import_tags):
-    alerts.remove_tag(TEST_TAGS[1].name)
+    alerts.remove_tag(import_tags[1].name)
     all_tags = [tag["name"] for tag in alerts.browse(include_tags=True, include_alerts=False)[0]]
-    assert TEST_TAGS[1].name not in all_tags
+    assert import_tags[1].name not in all_tags
 
     test_text_3 = db.session.query(Alert).filter_by(name="test_text_3").one()
-    assert TEST_TAGS[1].name not in test_text_3.tags
+    assert import_tags[1].name not in test_text_3.tags
+
+
+def test_serialize(import_alerts, import_tags, count_statements):
+    alert_names = [test_alert.name for test_alert in reversed(import_alerts)]
+    with count_statements() as statements:
+        serialized_alerts = serialize_alerts(alert_names + ["not_an_alert"])
+    assert len(statements) == 2
+    assert serialized_alerts == [test_alert.as_dict() for test_alert in reversed(import_alerts)]
+    assert serialized_alerts[1]["tags"] == ["first_two", "last_two"]
+
+    tag_names = [test_tag.name for test_tag in import_tags]
+    with count_statements() as statements:
+        serialized_tags = serialize_tags(tag_names)
+    assert len(statements) == 2
+    assert serialized_tags == [test_tag.as_dict() for test_tag in import_tags]
+    assert serialized_tags[2]["alerts"] == []
+
+
+# IMPORT
+def test_import_alerts(import_tags):
+    import_results = alerts.import_alerts(
+        alerts=[
+            {"name": "test_text_1", "text": "New Text 1", "sound": "http://www.test.com/test_sound_1.mp3"},
+            {"name": "Test Text 4", "text": "Test Text 4", "tags": ["last_two", "new_tag", "ignore this tag"]},
+            {"name": "bad_sound", "text": "Bad", "sound": "http://www.test.com/bad.blah"},
+            {"text": "No name"},
+        ],
+        tags=[
+            {
+                "name": "New Tag",
+                "display_name": "new tag",
+                "category": "reference",
+                "alerts": ["test_text_1", "test_text_4"],
+            },
+            {"name": "bad_category", "display_name": "bad", "category": "blah"},
+        ],
+    )
+    assert import_results["alerts"] == 2
+    assert import_results["tags"] == 1
+    assert import_results["associations"] == 3
+    assert [(error["type"], error["index"]) for error in import_results["errors"]] == [
+        ("alert", 2),
+        ("alert", 3),
+        ("tag", 1),
+    ]
+
+    # existing alerts are updated, new ones are created under their standardized name
+    assert alerts.alert_details("test_text_1")["text"] == "New Text 1"
+    assert alerts.alert(name="test_text_4", hit_socket=False)["text"] == "Test Text 4"
+    assert alerts.alert_details("test_text_1")["tags"] == ["first_two", "new_tag"]
+    assert alerts.alert_details("test_text_4")["tags"] == ["last_two", "new_tag"]
+    assert alerts.tag_details("new_tag")["category"] == "reference"
+    assert db.session.query(Alert).filter_by(name="bad_sound").one_or_none() is None
+
+    # importing again doesn't duplicate anything
+    import_results = alerts.import_alerts(alerts=[{"name": "test_text_4", "tags": ["last_two"]}])
+    assert import_results["associations"] == 0
+    assert alerts.alert_details("test_text_4")["text"] == ""
+
+
+# SEARCH
+def test_search(import_tags, count_statements):
+    def search_names(search, **kwargs):
+        return [(result["type"], result["name"]) for result in alerts.browse(search=search, **kwargs)[0]]
+
+    # alert text and tag display names are searchable too, by the start of any word
+    assert search_names("text 3") == [("Alert", "test_text_3")]
+    assert search_names("tex 3") == [("Alert", "test_text_3")]
+    assert search_names("las", include_alerts=False) == [("Tag", "last_two")]
+    assert search_names("xyz") == []
+    # anything browse used to find by a substring of the name is still found
+    assert search_names("ext_3") == [("Alert", "test_text_3")]
+    assert search_names("ext", include_tags=False) == [
+        ("Alert", "test_text_1"),
+        ("Alert", "test_text_2"),
+        ("Alert", "test_text_3"),
+    ]
+    assert search_names("st_two", include_alerts=False) == [("Tag", "first_two"), ("Tag", "last_two")]
+    assert search_names("_", include_alerts=False) == [("Tag", "first_two"), ("Tag", "last_two")]
+    assert search_names("text")[0] == ("Alert", "test_text_1")
+
+    # better matches come first within each tier
+    alerts.save_alert(name="two_tone", text="Two", sound="http://www.test.com/two_tone.mp3")
+    assert search_names("two")[:4] == [
+        ("Tag", "first_two"),
+        ("Tag", "last_two"),
+        ("Alert", "two_tone"),
+        ("Alert", "test_text_1"),
+    ]
+
+    # writes show up in the next search, without loading the whole catalog again
+    alerts.remove_alert("two_tone")
+    with count_statements() as statements:
+        assert ("Alert", "two_tone") not in search_names("two")
+    assert len(statements) == 0
+    alerts.set_alerts("first_two", ["test_text_3"])
+    alerts.save_tag(name="tone_deaf", display_name="Tone Deaf", alerts=["test_text_2"])
+    with count_statements() as statements:
+        assert search_names("first") == [("Tag", "first_two"), ("Alert", "test_text_3")]
+        assert search_names("deaf") == [("Tag", "tone_deaf"), ("Alert", "test_text_2")]
+    assert len(statements) == 0
+    alerts.remove_tag("tone_deaf")
+    assert search_names("deaf") == []
+
+    # so do imports, along with the alerts they add to existing tags
+    alerts.import_alerts(alerts=[{"name": "Deaf Tone", "text": "Deaf", "tags": ["first_two"]}])
+    with count_statements() as statements:
+        assert search_names("deaf") == [("Alert", "deaf_tone")]
+        assert search_names("first", include_tags=False) == [("Alert", "deaf_tone"), ("Alert", "test_text_3")]
+        assert search_names("af_to") == [("Alert", "deaf_tone")]
+    assert len(statements) == 0
+
+
+def test_media_manifest(import_alerts, count_statements):
+    sounds = [test_alert.sound for test_alert in import_alerts]
+    manifest = media.changes()
+    assert manifest["full"]
+    assert manifest["removed"] == []
+    assert [entry["url"] for entry in manifest["added"]] == sounds
+    assert manifest["added"][0] == {"url": sounds[0], "type": "sound", "format": "mp3", "mime_type": "audio/mpeg"}
+    version = manifest["version"]
+
+    unchanged = media.changes(since=version)
+    assert unchanged == {"version": version, "full": False, "added": [], "removed": []}
+
+    # overlays get told about the new version and only fetch what changed since theirs
+    socketio_queue = mock.Mock()
+    with mock.patch.object(get_app(), "socketio_queue", new=socketio_queue, create=True):
+        alerts.save_alert(
+            name=import_alerts[0].name,
+            text="New",
+            sound="http://www.test.com/new_sound.ogg",
+            image="http://www.test.com/new_image.png",
+        )
+    new_manifest = media.changes(since=version)
+    assert new_manifest["version"] != version
+    assert not new_manifest["full"]
+    assert new_manifest["added"] == [
+        {"url": "http://www.test.com/new_image.png", "type": "image", "format": "png", "mime_type": "image/png"},
+        {"url": "http://www.test.com/new_sound.ogg", "type": "sound", "format": "ogg", "mime_type": "audio/ogg"},
+    ]
+    assert new_manifest["removed"] == [sounds[0]]
+    socketio_queue.sync_q.put.assert_any_call(
+        {"namespace": "live", "event": "MediaManifest", "data": {"version": new_manifest["version"]}}
+    )
+
+    # saving without changing any media keeps the version
+    alerts.save_alert(
+        name=import_alerts[1].name, text="Other", sound=sounds[1], image="", thumbnail=import_alerts[1].thumbnail
+    )
+    assert media.changes(since=new_manifest["version"])["added"] == []
+
+    # a write only reads the alert it changed, and a url stays while any alert still uses it
+    with count_statements() as statements:
+        alerts.save_alert(name="shared_sound", text="Shared", sound=sounds[1])
+    filtered = re.compile(r"WHERE alert\.(id|name) (=|IN)")
+    media_scans = [sql for _, _, sql, *_ in statements if "alert.sound" in sql and not filtered.search(sql)]
+    assert media_scans == []
+    alerts.remove_alert(import_alerts[1].name)
+    assert media.changes(since=new_manifest["version"])["removed"] == []
+    alerts.remove_alert("shared_sound")
+    assert media.changes(since=new_manifest["version"])["removed"] == [sounds[1]]
+
+    assert media.changes(since="unknown")["full"]
 
 
 # BROWSE
-def test_browse(import_tags):
+def test_browse(import_alerts, import_tags):
     def dict_alert(alert, tag=False):
         return {
             "name": alert.name,
@@ -405,18 +570,18 @@ def test_browse(import_tags):
     db.session.query(Tag).filter_by(name="random").delete()
 
     # without tags
-    assert alerts.browse(limit=1, include_tags=False)[0][0] == dict_alert(TEST_ALERTS[0])
-    assert alerts.browse(limit=1, page=2, include_tags=False)[0][0] == dict_alert(TEST_ALERTS[1])
-    assert alerts.browse(limit=2, page=2, include_tags=False)[0][0] == dict_alert(TEST_ALERTS[2])
-    assert alerts.browse(sort="-name", include_tags=False)[0][0] == dict_alert(TEST_ALERTS[2])
-    assert alerts.browse(search="tExT_2", include_tags=False)[0][0] == dict_alert(TEST_ALERTS[1])
+    assert alerts.browse(limit=1, include_tags=False)[0][0] == dict_alert(import_alerts[0])
+    assert alerts.browse(limit=1, page=2, include_tags=False)[0][0] == dict_alert(import_alerts[1])
+    assert alerts.browse(limit=2, page=2, include_tags=False)[0][0] == dict_alert(import_alerts[2])
+    assert alerts.browse(sort="-name", include_tags=False)[0][0] == dict_alert(import_alerts[2])
+    assert alerts.browse(search="tExT_2", include_tags=False)[0][0] == dict_alert(import_alerts[1])
 
     # with tags
-    assert alerts.browse(limit=1, include_tags=True)[0][0] == dict_alert(TEST_TAGS[0], tag=True)
-    assert alerts.browse(limit=1, page=2, include_tags=True)[0][0] == dict_alert(TEST_TAGS[1], tag=True)
-    assert alerts.browse(limit=2, page=2, include_tags=True)[0][0] == dict_alert(TEST_ALERTS[0], tag=False)
-    assert alerts.browse(sort="-name", include_tags=True)[0][0] == dict_alert(TEST_TAGS[1], tag=True)
-    assert alerts.browse(search="tExT_2")[0][0] == dict_alert(TEST_ALERTS[1], tag=False)
+    assert alerts.browse(limit=1, include_tags=True)[0][0] == dict_alert(import_tags[0], tag=True)
+    assert alerts.browse(limit=1, page=2, include_tags=True)[0][0] == dict_alert(import_tags[1], tag=True)
+    assert alerts.browse(limit=2, page=2, include_tags=True)[0][0] == dict_alert(import_alerts[0], tag=False)
+    assert alerts.browse(sort="-name", include_tags=True)[0][0] == dict_alert(import_tags[1], tag=True)
+    assert alerts.browse(search="tExT_2")[0][0] == dict_alert(import_alerts[1], tag=False)
 
     # check to see the only difference between with/without tags is tags at the beginning
     sans_tags, _ = alerts.browse(limit=10, include_tags=False)
@@ -426,7 +591,113 @@ def test_browse(import_tags):
     # when searching and a tag matches, include all the alerts associated with each matched tag
     results, _ = alerts.browse(search="first two", include_tags=True)
     assert results == [
-        dict_alert(TEST_TAGS[0], tag=True),
-        dict_alert(TEST_ALERTS[0], tag=False),
-        dict_alert(TEST_ALERTS[1], tag=False),
+        dict_alert(import_tags[0], tag=True),
+        dict_alert(import_alerts[0], tag=False),
+        dict_alert(import_alerts[1], tag=False),
     ]
+
+    # alerts matched directly and through a tag only show up once, ranked as a direct match
+    results, page_metadata = alerts.browse(search="_t")
+    assert results == [
+        dict_alert(import_tags[0], tag=True),
+        dict_alert(import_tags[1], tag=True),
+        dict_alert(import_alerts[0], tag=False),
+        dict_alert(import_alerts[1], tag=False),
+        dict_alert(import_alerts[2], tag=False),
+    ]
+    assert page_metadata["total"] == 5
+
+    # totals count every page, not just the current one
+    _, page_metadata = alerts.browse(limit=1, page=2, include_tags=True)
+    assert {key: page_metadata[key] for key in ["total", "page", "limit"]} == {"total": 5, "page": 2, "limit": 1}
+    results, page_metadata = alerts.browse(limit=2, page=10, include_tags=False)
+    assert results == []
+    assert page_metadata["total"] == 3
+
+
+def test_browse_cursor(import_alerts, import_tags):
+    alerts.tag_alert(import_tags[1].name, hit_socket=False)
+    usage.flush()
+
+    def walk(limit, **kwargs):
+        names = []
+        cursor = None
+        while True:
+            results, page_metadata = alerts.browse(limit=limit, cursor=cursor, **kwargs)
+            names.extend(result["name"] for result in results)
+            cursor = page_metadata["next_cursor"]
+            if not cursor:
+                return names
+
+    for sort in alerts.SORT_OPTIONS + [f"-{sort}" for sort in alerts.SORT_OPTIONS]:
+        everything = [result["name"] for result in alerts.browse(sort=sort, limit=10)[0]]
+        assert walk(2, sort=sort) == everything
+        assert walk(1, sort=sort, include_tags=False) == everything[len(import_tags) :]
+        assert walk(2, sort=sort, search="_t") == [
+            result["name"] for result in alerts.browse(sort=sort, search="_t", limit=10)[0]
+        ]
+
+    results, page_metadata = alerts.browse(limit=2, include_total=False)
+    assert page_metadata["total"] is None
+    _, page_metadata = alerts.browse(limit=2, cursor=page_metadata["next_cursor"])
+    assert page_metadata["total"] == len(import_tags) + len(import_alerts)
+    assert page_metadata["page"] is None
+    assert alerts.browse(limit=len(import_tags) + len(import_alerts))[1]["next_cursor"] is None
+
+    # a cursor only works with the sort it was made for
+    _, page_metadata = alerts.browse(sort="name", limit=2)
+    with pytest.raises(Exception, match="Invalid cursor"):
+        alerts.browse(sort="-name", limit=2, cursor=page_metadata["next_cursor"])
+    with pytest.raises(Exception, match="Invalid cursor"):
+        alerts.browse(limit=2, cursor="not a cursor")
+    # or the search
+    _, page_metadata = alerts.browse(search="_t", limit=2)
+    with pytest.raises(Exception, match="Invalid cursor"):
+        alerts.browse(limit=2, cursor=page_metadata["next_cursor"])
+    with pytest.raises(Exception, match="Invalid cursor"):
+        alerts.browse(limit=2, cursor=encode_cursor({"sort": "name"}))
+
+
+def test_popularity(import_alerts, import_tags):
+    db.session.query(Tag).filter_by(name="random").delete()
+
+    def browse_names(**kwargs):
+        return [result["name"] for result in alerts.browse(**kwargs)[0]]
+
+    for _ in range(3):
+        alerts.alert(import_alerts[2].name, hit_socket=False)
+    alerts.alert(import_alerts[1].name, hit_socket=False)
+    alerts.tag_alert(import_tags[1].name, hit_socket=False)
+
+    # triggers are only counted in memory until flushed
+    assert db.session.query(Usage).count() == 0
+    assert usage.flush() == 3
+    assert usage.flush() == 0
+    totals = {(row.result_type, row.name): row.total for row in db.session.query(Usage)}
+    assert totals[("Tag", import_tags[1].name)] == 1
+    assert totals[("Alert", import_alerts[1].name)] + totals[("Alert", import_alerts[2].name)] == 5
+
+    alert_names = [test_alert.name for test_alert in import_alerts]
+    assert browse_names(sort="popular", include_tags=False) == alert_names[::-1]
+    assert browse_names(sort="-popular", include_tags=False) == alert_names
+    assert browse_names(sort="popular") == [import_tags[1].name, import_tags[0].name] + alert_names[::-1]
+    assert browse_names(sort="popular", search="test", include_tags=False) == alert_names[::-1]
+    assert browse_names(sort="-popular", search="test", include_tags=False) == alert_names
+
+    # pages run from the triggered ones into the rest, by page number too
+    for sort in ["popular", "-popular"]:
+        pages = [browse_names(sort=sort, limit=2, page=page) for page in range(1, 4)]
+        assert sum(pages, []) == browse_names(sort=sort)
+    assert alerts.browse(sort="popular", limit=2, page=2)[1]["total"] == len(import_tags) - 1 + len(import_alerts)
+
+    # flushing again adds to what's there
+    for _ in range(5):
+        alerts.alert(import_alerts[0].name, hit_socket=False)
+    usage.flush()
+    found_usage = db.session.query(Usage).filter_by(result_type="Alert", name=import_alerts[0].name).one()
+    assert found_usage.total == 5
+    assert round(usage.decayed_score(found_usage.score), 2) == 5
+    assert browse_names(sort="popular", include_tags=False)[0] == import_alerts[0].name
+
+    alerts.remove_alert(import_alerts[0].name)
+    assert not db.session.query(Usage).filter_by(result_type="Alert", name=import_alerts[0].name).count()
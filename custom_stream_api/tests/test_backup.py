@@ -0,0 +1,113 @@
+import json
+import mock
+import pytest
+
+from custom_stream_api import settings
+from custom_stream_api.alerts import alerts
+from custom_stream_api.backup import backup
+from custom_stream_api.chatbot import bans, timers
+from custom_stream_api.counts import counts
+from custom_stream_api.lists import lists
+
+
+@pytest.fixture(scope="function")
+def setup(import_tag_counts, import_lists, import_aliases, session):
+    timers.add_timer("twitch_chatbot", "!echo hi", "0 * * * *", repeat=True)
+    bans.ban(["troll"])
+    yield session
+
+
+def test_export_import(setup, app):
+    lines = list(backup.export_lines())
+    assert json.loads(lines[0]) == {"type": "header", "version": backup.FORMAT_VERSION}
+    exported_types = {json.loads(line)["type"] for line in lines[1:]}
+    assert exported_types == set(backup.MODELS_BY_TYPE)
+    assert all("id" not in json.loads(line).get("data", {}) for line in lines)
+
+    lists.set_list("list1", ["changed"])
+    counts.add_to_count("test_count")
+    alerts.save_alert(name="not_in_the_export", text="Gone after the import")
+    bans.unban(["troll"])
+
+    imported = backup.import_lines(lines)
+    assert imported["alert"] == 3
+    assert imported["list_item"] == 5
+    assert imported["timer"] == 1
+    assert bans.is_banned("troll")
+    # restoring brings back exactly what was exported
+    assert list(backup.export_lines()) == lines
+    assert "not_in_the_export" not in [result["name"] for result in alerts.browse(limit=10)[0]]
+
+    client = app.flask_app.test_client()
+    response = client.get("/export")
+    assert response.mimetype == "application/x-ndjson"
+    assert response.get_data(as_text=True) == "".join(lines)
+    response = client.post("/import", data="".join(lines), content_type="application/x-ndjson")
+    assert response.status_code == 200
+    assert response.json["imported"] == imported
+
+
+@mock.patch.object(settings, "COUNT_WRITE_BEHIND_MS", 1000)
+def test_write_behind(setup):
+    counts.set_count("test_count", 1)
+    counts.add_to_count("test_count")
+    lines = list(backup.export_lines())
+    exported_counts = {
+        record["data"]["name"]: record["data"]["count"]
+        for record in map(json.loads, lines)
+        if record["type"] == "count"
+    }
+    assert exported_counts["test_count"] == 2
+    assert counts.flush() == 0
+
+    counts.add_to_count("test_count")
+    backup.import_lines(lines)
+    counts.flush()
+    assert counts.get_count("test_count") == 2
+
+
+def test_import_version_1(session):
+    # exported before lists had a size and items a position, and before bans had their own table
+    lines = [
+        {"type": "header", "version": 1},
+        {"type": "list", "data": {"name": "list1", "current_index": 0, "created_at": "2024-01-01T00:00:00+00:00"}},
+        {"type": "list", "data": {"name": "list2", "current_index": 0, "created_at": "2024-01-01T00:00:00+00:00"}},
+        # bans were a list before version 3
+        {
+            "type": "list",
+            "data": {"name": "banned_users", "current_index": 0, "created_at": "2024-01-01T00:00:00+00:00"},
+        },
+        {"type": "list_item", "data": {"list_name": "list1", "item": "one"}},
+        {"type": "list_item", "data": {"list_name": "list2", "item": "uno"}},
+        {"type": "list_item", "data": {"list_name": "list1", "item": "two"}},
+        {"type": "list_item", "data": {"list_name": "banned_users", "item": "troll"}},
+    ]
+    imported = backup.import_lines(json.dumps(line) for line in lines)
+    assert imported["list"] == 2
+    assert imported["list_item"] == 3
+    assert imported["banned_user"] == 1
+    assert bans.list_bans() == ["troll"]
+    assert not lists.list_exists("banned_users")
+    assert lists.get_list("list1") == ["one", "two"]
+    assert lists.get_list_size("list1") == 2
+    assert lists.get_list_item("list1", 2)[0].item == "two"
+    assert lists.get_list_size("list2") == 1
+
+    with pytest.raises(Exception, match="Unsupported export version: 99"):
+        backup.import_lines([json.dumps({"type": "header", "version": 99})])
+
+
+def test_import_errors(setup):
+    lines = list(backup.export_lines())
+
+    with pytest.raises(Exception, match="first line must be its header"):
+        backup.import_lines(lines[1:])
+    with pytest.raises(Exception, match="first line must be its header"):
+        backup.import_lines([])
+    with pytest.raises(Exception, match="rows must come before"):
+        backup.import_lines([lines[0]] + lines[:0:-1])
+    with pytest.raises(Exception, match="unknown alert field: id"):
+        backup.import_lines([lines[0], json.dumps({"type": "alert", "data": {"id": 1, "name": "a", "text": ""}})])
+
+    # a failed import leaves everything as it was
+    assert list(backup.export_lines()) == lines
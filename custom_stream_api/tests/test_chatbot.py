@@ -2,18 +2,14 @@ import mock
 import pytest
 
 from collections import namedtuple
+from datetime import datetime, timedelta
 
 from custom_stream_api.alerts import alerts
-from custom_stream_api.chatbot import aliases
+from custom_stream_api.chatbot import aliases, bans, timers
 from custom_stream_api.chatbot.chatbot import ChatBot
 from custom_stream_api.chatbot.models import Badges, BADGE_NAMES, Timer
-from custom_stream_api.lists import lists
-from custom_stream_api.shared import get_app
-
-from custom_stream_api.tests.factories.chatbot_factories import AliasFactory
-from custom_stream_api.tests.test_alerts import import_tags, import_alerts  # noqa
-
-TEST_ALIAS_DICTS = []
+from custom_stream_api.metrics import latency
+from custom_stream_api.shared import db, get_app
 
 Event = namedtuple(
     "Event",
@@ -24,35 +20,8 @@ Event = namedtuple(
 )
 
 
-@pytest.fixture(scope="function")
-def import_aliases(session):
-    global TEST_ALIAS_DICTS
-
-    session.query(AliasFactory._meta.model).delete()
-    session.commit()
-
-    TEST_ALIASES = [
-        AliasFactory(alias="test_alert", badge="chat", command="!alert test_text_1"),
-        AliasFactory(alias="chat_test_alias", badge="chat", command="!get_count test_count"),
-        AliasFactory(alias="sub_test_alias", badge="subscriber", command="!get_count test_count"),
-        AliasFactory(alias="reset_session", badge="broadcaster", command="!reset_count test_count test_count_2"),
-        AliasFactory(alias="test_alias_args", badge="vip", command="!set_count test_count"),
-        AliasFactory(alias="mod_test_alias", badge="vip", command="!set_count test_count 10"),
-        AliasFactory(alias="broadcaster_test_alias", badge="broadcaster", command="!set_count test_count 10"),
-    ]
-
-    TEST_ALIAS_DICTS = [test_alias.as_dict() for test_alias in TEST_ALIASES]
-    session.add_all(TEST_ALIASES)
-    session.commit()
-
-    yield session
-
-    session.query(AliasFactory._meta.model).delete()
-    session.commit()
-
-
 def fake_alert_api(cls, user, badges, text):
-    if user in lists.get_list("banned_users"):
+    if bans.is_banned(user):
         return
     elif not cls._badge_check(badges, Badges.VIP) and cls.spamming(user):
         cls.chat("No spamming {}. Wait another {} seconds.".format(user, cls.timeout))
@@ -69,7 +38,7 @@ def fake_alert_api(cls, user, badges, text):
 
 
 def fake_tag_alert_api(cls, user, badges, text):
-    if user in lists.get_list("banned_users"):
+    if bans.is_banned(user):
         return
     elif not cls._badge_check(badges, Badges.VIP) and cls.spamming(user):
         cls.chat("No spamming {}. Wait another {} seconds.".format(user, cls.timeout))
@@ -217,7 +186,7 @@ def test_get_aliases_empty(chatbot):
 
 
 def test_import_export_aliases(import_aliases):
-    assert aliases.list_aliases() == TEST_ALIAS_DICTS
+    assert aliases.list_aliases() == import_aliases
 
 
 def test_remove_alias(import_aliases):
@@ -253,7 +222,7 @@ def test_get_aliases(import_aliases, chatbot):
 
 @mock.patch.object(ChatBot, "alert_api", new=fake_alert_api)
 @mock.patch.object(ChatBot, "tag_alert_api", new=fake_tag_alert_api)
-def test_aliases(import_aliases, import_tags, chatbot, app):  # noqa
+def test_aliases(import_aliases, import_tags, chatbot, app):
     badge_level = [Badges.SUBSCRIBER]
     chatbot.parse_message("test_user", "!mod_test_alias", badge_level)
     expected_responses = []
@@ -297,6 +266,21 @@ def test_reminder(chatbot, session):
     assert found_timer is not None
 
 
+def test_check_timers(session, app):
+    timers.add_timer("twitch_chatbot", "!echo hi", "0 * * * *", repeat=True)
+    client = app.flask_app.test_client()
+    etag = client.get("/chatbot/timers").headers["ETag"]
+
+    # a tick with nothing due keeps the ETag
+    timers.check_timers(app, db, execute=False)
+    assert client.get("/chatbot/timers", headers={"If-None-Match": etag}).status_code == 304
+
+    session.query(Timer).update({Timer.next_time: datetime.now(timers.TZ) - timedelta(minutes=1)})
+    session.commit()
+    timers.check_timers(app, db, execute=False)
+    assert client.get("/chatbot/timers", headers={"If-None-Match": etag}).status_code == 200
+
+
 # COUNTS
 def test_get_count_commands(chatbot):
     badge_level = []
@@ -609,7 +593,7 @@ def test_get_alert_commands(chatbot):
 
 @mock.patch.object(ChatBot, "alert_api", new=fake_alert_api)
 @mock.patch.object(ChatBot, "tag_alert_api", new=fake_tag_alert_api)
-def test_alert_commands(chatbot, import_tags):  # noqa
+def test_alert_commands(chatbot, import_tags):
     badge_level = [Badges.VIP]
     chatbot.parse_message("test_user", "!alert test_text_1", badge_level)
     expected_response = "/me Test Text 1"
@@ -688,6 +672,58 @@ def test_alert_commands(chatbot, import_tags):  # noqa
     assert chatbot.queue[-1] == expected_response
 
 
+def test_bans(session, app, count_statements):
+    assert bans.ban(["troll", "spammer", "troll"]) == ["troll", "spammer"]
+    # banning again doesn't add anyone twice
+    assert bans.ban(["troll"]) == []
+    assert bans.list_bans() == ["spammer", "troll"]
+
+    # checking is done from memory
+    with count_statements() as statements:
+        assert bans.is_banned("troll")
+        assert not bans.is_banned("chatter")
+    assert len(statements) == 0
+
+    assert bans.unban(["troll", "chatter"]) == ["troll"]
+    assert not bans.is_banned("troll")
+
+    client = app.flask_app.test_client()
+    assert client.post("/chatbot/ban", json={"names": ["a", "b"]}).json == {"banned": ["a", "b"]}
+    assert client.post("/chatbot/unban", json={"names": ["a"]}).json == {"unbanned": ["a"]}
+    assert client.get("/chatbot/bans").json == ["b", "spammer"]
+    assert bans.is_banned("b")
+
+
+@mock.patch.object(ChatBot, "alert_api", new=fake_alert_api)
+def test_latency(chatbot, import_tags):
+    latency.reset()
+    latency.start_trace("test")
+    latency.mark("badges")
+    chatbot.parse_message("test_user", "!alert test_text_1", [Badges.VIP])
+    summary = latency.summary()
+    assert set(summary.keys()) == {"badges", "aliases", "command", "lookup", "total"}
+    assert set(summary["total"].keys()) == {"count", "p50", "p95", "p99"}
+    assert summary["total"]["count"] == 1
+
+    # plain chat and commands that don't trigger an alert aren't recorded
+    for message in ["hello", "!echo hello", "!unknown"]:
+        latency.start_trace("test")
+        latency.mark("badges")
+        chatbot.parse_message("test_user", message, [Badges.VIP])
+    assert latency.summary()["total"]["count"] == 1
+    assert latency.summary()["badges"]["count"] == 1
+
+    # once handed off to the socket.io queue, only the emitter finishes the trace
+    trace = latency.start_trace("test")
+    assert latency.hand_off() == trace
+    latency.end_trace()
+    assert latency.summary()["total"]["count"] == 1
+    trace.mark("emit")
+    trace.finish()
+    assert latency.summary()["total"]["count"] == 2
+    assert latency.summary()["emit"]["count"] == 1
+
+
 def test_stress(chatbot):
     badge_level = [Badges.BROADCASTER]
     expected_responses = []
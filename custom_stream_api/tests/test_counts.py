@@ -1,50 +1,37 @@
-import pytest
-
-from custom_stream_api.counts import counts
-from custom_stream_api.tests.factories.counts_factories import CountFactory
-
-TEST_COUNTS_DICTS = []
-
-
-@pytest.fixture(scope="function")
-def import_counts(session):
-    global TEST_COUNTS_DICTS
-
-    TEST_COUNTS = [
-        CountFactory(
-            name="count1",
-            count=-10,
-            tag_name=None,
-        ),
-        CountFactory(
-            name="count2",
-            count=20,
-            tag_name=None,
-        ),
-        CountFactory(
-            name="count3",
-            count=90,
-            tag_name=None,
-        ),
-    ]
-    TEST_COUNTS_DICTS = [test_count.as_dict() for test_count in TEST_COUNTS]
-    session.add_all(TEST_COUNTS)
-    session.commit()
+import threading
+from datetime import datetime, timedelta, timezone
 
-    yield session
+import mock
+from sqlalchemy.orm import scoped_session, sessionmaker
 
-    session.query(CountFactory._meta.model).delete()
-    session.commit()
+from custom_stream_api import settings
+from custom_stream_api.counts import counts, history
+from custom_stream_api.counts.models import Count, CountEvent, CountRollup
+from custom_stream_api.shared import db, get_app
 
 
 def test_export_counts(import_counts):
-    assert counts.list_counts() == TEST_COUNTS_DICTS
+    assert counts.list_counts() == import_counts
 
 
 def test_get_count(import_counts):
     assert counts.get_count("count2") == 20
 
 
+def test_get_counts(import_counts):
+    assert counts.get_counts(["count3", "missing", "count1", "count3"]) == {"count3": 90, "count1": -10}
+    assert counts.get_counts([]) == {}
+
+
+def test_get_counts_batch(import_counts, app, count_statements):
+    client = app.flask_app.test_client()
+    with count_statements() as statements:
+        response = client.get("/counts/batch?names=count1,missing,count2")
+    assert response.status_code == 200
+    assert response.json == {"counts": {"count1": -10, "count2": 20}, "missing": ["missing"]}
+    assert len(statements) == 1
+
+
 def test_add_to_count(import_counts):
     assert counts.add_to_count("count1") == -9
 
@@ -69,3 +56,157 @@ def test_copy_count(import_counts):
 def test_remove_count(import_counts):
     counts.remove_count("count1")
     assert "count1" not in counts.list_counts()
+
+
+def test_publish_updates(import_counts):
+    socketio_queue = mock.Mock()
+    with mock.patch.object(get_app(), "socketio_queue", new=socketio_queue, create=True):
+        for _ in range(3):
+            counts.add_to_count("count1")
+        counts.set_count("count2", 5)
+        counts.remove_count("count3")
+
+        # one update per count, with its latest value
+        assert counts.publish_updates() == 3
+        assert counts.publish_updates() == 0
+    assert socketio_queue.sync_q.put.call_args_list == [
+        mock.call({"namespace": "counts", "event": "CountUpdate", "data": {"name": name, "value": value}})
+        for name, value in [("count1", -7), ("count2", 5), ("count3", None)]
+    ]
+    assert counts.snapshot() == {"count1": -7, "count2": 5}
+    assert counts.snapshot(["count2"]) == {"count2": 5}
+
+
+def test_history(import_counts, app, session):
+    start = datetime(2026, 10, 17, 20, 0, 10, tzinfo=timezone.utc)
+
+    def changed_at(*changes):
+        with mock.patch.object(history, "datetime") as mock_datetime:
+            mock_datetime.now.side_effect = [start + timedelta(seconds=seconds) for seconds, _ in changes]
+            for _, change in changes:
+                change()
+
+    def buckets(bucket, **kwargs):
+        return [
+            (found["start"][11:19], found["delta"], found["events"], found["value"])
+            for found in history.history("count1", bucket=bucket, **kwargs)
+        ]
+
+    add = lambda: counts.add_to_count("count1")  # noqa: E731
+    # a couple of minutes of counting, then a reset five hours later in what's another stream
+    changed_at((0, add), (20, add), (70, add), (5 * 60 * 60, lambda: counts.set_count("count1", 0)))
+    assert history.flush() == 4
+    assert history.flush() == 0
+    assert buckets("minute") == [("20:00:00", 2, 2, -8), ("20:01:00", 1, 1, -7), ("01:00:00", 0, 1, 0)]
+    assert buckets("hour") == [("20:00:00", 3, 3, -7), ("01:00:00", 0, 1, 0)]
+    assert buckets("stream") == [("20:00:10", 3, 3, -7), ("01:00:10", 0, 1, 0)]
+    assert buckets("hour", from_=start + timedelta(hours=1)) == [("01:00:00", 0, 1, 0)]
+    assert buckets("hour", to=start + timedelta(hours=1)) == [("20:00:00", 3, 3, -7)]
+
+    # the current stream carries on after a restart, and reading history writes what's pending first
+    history.clear()
+    changed_at((5 * 60 * 60 + 30, add))
+    assert buckets("stream")[-1] == ("01:00:10", 1, 2, 1)
+    assert buckets("minute")[-1] == ("01:00:00", 1, 2, 1)
+
+    client = app.flask_app.test_client()
+    etag = client.get("/counts/history?name=count1&bucket=minute").headers["ETag"]
+
+    # a week later the minutes are gone, the events are kept for a month
+    assert history.prune(now=start + timedelta(days=8)) == 3
+    assert buckets("minute") == []
+    assert len(buckets("hour")) == 2
+    assert session.query(CountEvent).count() == 5
+    assert history.prune(now=start + timedelta(days=31)) == 5
+    assert session.query(CountRollup).filter_by(bucket="hour").count() == 2
+
+    # pruning changes the history, cached responses are stale unless nothing was deleted
+    response = client.get("/counts/history?name=count1&bucket=minute", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert history.prune(now=start + timedelta(days=31)) == 0
+    headers = {"If-None-Match": response.headers["ETag"]}
+    assert client.get("/counts/history?name=count1&bucket=minute", headers=headers).status_code == 304
+
+    response = client.get("/counts/history?name=count1&bucket=stream&from=2026-10-18T00:00:00")
+    assert response.status_code == 200
+    assert [found["delta"] for found in response.json] == [1]
+    assert client.get("/counts/history?name=count1&bucket=day").status_code == 422
+
+
+def test_concurrent_add_to_count(session):
+    # every thread needs its own connection for the increments to actually race. No imported counts, their rows aren't
+    # committed and their random ids can collide with ones the threads take from the sequence
+    thread_sessions = scoped_session(sessionmaker(bind=db.engine))
+    threads_count, adds_per_thread = 8, 50
+
+    def add_many():
+        try:
+            for _ in range(adds_per_thread):
+                counts.add_to_count("raced")
+        finally:
+            thread_sessions.remove()
+
+    with mock.patch.object(db, "session", thread_sessions):
+        threads = [threading.Thread(target=add_many) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        try:
+            final_count = counts.get_count("raced")
+            counts.remove_count("raced")
+        finally:
+            thread_sessions.remove()
+    assert final_count == threads_count * adds_per_thread
+
+
+@mock.patch.object(settings, "COUNT_WRITE_BEHIND_MS", 100)
+def test_write_behind(import_counts, session):
+    def stored_count(name):
+        return session.query(Count.count).filter_by(name=name).scalar()
+
+    assert [counts.add_to_count("count1") for _ in range(3)] == [-9, -8, -7]
+    assert counts.subtract_from_count("count1") == -8
+    assert counts.add_to_count("new_count") == 1
+    # nothing's written yet, but reads include what's pending
+    assert stored_count("count1") == -10
+    assert stored_count("new_count") is None
+    assert counts.get_count("count1") == -8
+    assert counts.get_count("new_count") == 1
+
+    # setting a count replaces what was pending for it
+    counts.add_to_count("count2")
+    assert counts.set_count("count2", 5) == 5
+
+    assert counts.flush() == 2
+    assert counts.flush() == 0
+    assert stored_count("count1") == -8
+    assert stored_count("count2") == 5
+    assert stored_count("new_count") == 1
+
+    counts.add_to_count("count3")
+    assert [count["count"] for count in counts.list_counts()] == [-8, 5, 91, 1]
+
+
+def test_conditional_get(import_counts, app, count_statements):
+    client = app.flask_app.test_client()
+    response = client.get("/counts/")
+    assert response.status_code == 200
+    assert [count["count"] for count in response.json] == [-10, 20, 90]
+    etag = response.headers["ETag"]
+
+    # an unchanged resource is answered without going to the database
+    with count_statements() as statements:
+        response = client.get("/counts/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert len(statements) == 0
+
+    # a different query is a different ETag
+    assert client.get("/counts/?a=1", headers={"If-None-Match": etag}).status_code == 200
+
+    counts.add_to_count("count1")
+    response = client.get("/counts/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json[0]["count"] == -9
@@ -1,54 +1,31 @@
+import mock
 import pytest
 
 from custom_stream_api.shared import db
 from custom_stream_api.lists import lists
 from custom_stream_api.lists.models import List, ListItem
 
-from custom_stream_api.tests.factories.lists_factories import ListFactory, ListItemFactory
 
-TEST_LISTS_DICTS = []
-
-
-@pytest.fixture(scope="function")
-def import_lists(session):
-    global TEST_LISTS_DICTS
-
-    session.query(ListItemFactory._meta.model).delete()
-    session.query(ListFactory._meta.model).delete()
-    session.commit()
-
-    TEST_LISTS = [
-        ListFactory(
-            name="list1",
-        ),
-        ListFactory(
-            name="list2",
-        ),
-    ]
-    start = ListItemFactory(list_name="list1", item="one")
-    TEST_LIST_ITEMS = [
-        start,
-        ListItemFactory(id=start.id + 1, list_name="list1", item="two"),
-        ListItemFactory(id=start.id + 2, list_name="list1", item="three"),
-        ListItemFactory(id=start.id + 3, list_name="list2", item="four"),
-        ListItemFactory(id=start.id + 4, list_name="list2", item="five"),
-    ]
-
-    session.add_all(TEST_LISTS)
-    session.add_all(TEST_LIST_ITEMS)
-    session.commit()
-
-    TEST_LISTS_DICTS = [test_list.as_dict() for test_list in TEST_LISTS]
+def test_import_export(import_lists):
+    assert lists.list_lists() == import_lists
 
-    yield session
 
-    session.query(ListItemFactory._meta.model).delete()
-    session.query(ListFactory._meta.model).delete()
-    session.commit()
+def test_list_names(import_lists, app, count_statements):
+    assert lists.list_names() == ["list1", "list2"]
+    # names are kept in memory until a list is created or removed
+    with count_statements() as statements:
+        assert lists.list_exists("list1")
+        assert not lists.list_exists("list3")
+    assert len(statements) == 0
+    lists.add_to_list("list3", ["six"])
+    assert lists.list_exists("list3")
+    lists.remove_list("list3")
+    assert lists.list_names() == ["list1", "list2"]
 
-
-def test_import_export(import_lists):
-    assert lists.list_lists() == TEST_LISTS_DICTS
+    assert lists.list_summaries() == [{"name": "list1", "size": 3}, {"name": "list2", "size": 2}]
+    client = app.flask_app.test_client()
+    assert client.get("/lists/?summary=true").json == lists.list_summaries()
+    assert client.get("/lists/").json == import_lists
 
 
 def test_set_list(import_lists):
@@ -56,6 +33,49 @@ def test_set_list(import_lists):
     assert lists.get_list("list3") == ["six", "seven"]
 
 
+@mock.patch.object(lists, "CHUNK_SIZE", 2)
+def test_import_items(import_lists, app):
+    client = app.flask_app.test_client()
+    response = client.post("/lists/import?name=list1", data="uno\ndos\r\n\ntres\ncuatro\ncinco")
+    assert response.status_code == 200
+    assert response.json["added"] == 5
+    assert lists.get_list("list1") == ["uno", "dos", "tres", "cuatro", "cinco"]
+    assert lists.get_list_item("list1", -1) == (mock.ANY, 5)
+
+    response = client.post("/lists/import?name=list3&replace=false", data="one\ntwo\nthree")
+    assert response.json["added"] == 3
+    assert lists.import_items("list3", [b"four\n"], replace=False) == 1
+    assert lists.get_list("list3") == ["one", "two", "three", "four"]
+    assert lists.get_list_size("list3") == 4
+
+    lists.set_list("list3", ["only"])
+    assert lists.get_list("list3") == ["only"]
+    assert lists.get_list_item("list3", 1)[0].item == "only"
+
+
+@mock.patch.object(lists, "CHUNK_SIZE", 2)
+def test_get_list_page(import_lists, app):
+    items, page_metadata = lists.get_list_page("list1", page=2, limit=2)
+    assert items == ["three"]
+    assert page_metadata == {"total": 3, "page": 2, "limit": 2, "next_cursor": None}
+
+    client = app.flask_app.test_client()
+    response = client.get("/lists/get_list?name=list1&limit=2")
+    assert response.json["items"] == ["one", "two"]
+    next_cursor = response.json["page_metadata"]["next_cursor"]
+    response = client.get(f"/lists/get_list?name=list1&limit=2&cursor={next_cursor}")
+    assert response.json["items"] == ["three"]
+    assert response.json["page_metadata"]["next_cursor"] is None
+    # a cursor only continues the list it came from
+    assert client.get(f"/lists/get_list?name=list2&cursor={next_cursor}").status_code == 400
+
+    assert client.get("/lists/get_list?name=list1").json == ["one", "two", "three"]
+    response = client.get("/lists/get_list?name=list1&stream=true")
+    assert response.mimetype == "application/json"
+    assert response.json == ["one", "two", "three"]
+    assert client.get("/lists/get_list?name=list3&stream=true").json == []
+
+
 def test_get_list_item(import_lists):
     assert (lists.get_list_item("list1", 2)[0].item, lists.get_list_item("list1", 2)[1]) == ("two", 2)
     assert (lists.get_list_item("list1", -1)[0].item, lists.get_list_item("list1", -1)[1]) == ("three", 3)
@@ -93,7 +113,31 @@ def test_remove_from_list(import_lists):
     # If adding to list, dont change current_index cause it adds it at the end
 
 
+def test_positions(import_lists):
+    def positions(list_name):
+        list_items = db.session.query(ListItem).filter_by(list_name=list_name).order_by(ListItem.position)
+        return [(list_item.position, list_item.item) for list_item in list_items]
+
+    lists.add_to_list("list1", ["four", "five"])
+    assert lists.get_list_size("list1") == 5
+    lists.remove_from_list("list1", 2)
+    lists.remove_from_list("list1", -1)
+    # positions stay without gaps so every lookup is a single row
+    assert positions("list1") == [(1, "one"), (2, "three"), (3, "four")]
+    assert lists.get_list_size("list1") == 3
+    assert lists.get_list_item("list1", -3)[0].item == "one"
+    with pytest.raises(Exception, match="Index too low"):
+        lists.get_list_item("list1", -4)
+
+    list1 = db.session.query(List).filter_by(name="list1").first()
+    list1.current_index = 0
+    db.session.commit()
+    assert [lists.get_list_item("list1", "next")[1] for _ in range(4)] == [2, 3, 1, 2]
+
+
 def test_remove_list(import_lists):
     with pytest.raises(Exception, match="List not found"):
         lists.remove_list("list3")
-    assert lists.list_lists() == TEST_LISTS_DICTS
+    assert lists.list_lists() == import_lists
+    lists.remove_list("list2")
+    assert lists.list_lists() == import_lists[:1]